@@ -22,6 +22,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'ordering.middleware.MongoQueryStatsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -74,10 +75,70 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 MONGODB_NAME = os.getenv('MONGODB_NAME', 'kfc_db')
 MONGODB_HOST = os.getenv('MONGODB_URI', 'mongodb://localhost:27017/kfc_db')
 MONGODB_ALIAS = 'default'
+# Throwaway database the ordering tests connect to as the default alias and drop afterwards;
+# its name must end in '_test'
+MONGODB_TEST_URI = os.getenv('MONGODB_TEST_URI', f'mongodb://localhost:27017/{MONGODB_NAME}_test')
+# Client options (pool, timeouts, wire compression, read preference)
+MONGODB_MAX_POOL_SIZE = int(os.getenv('MONGODB_MAX_POOL_SIZE', '50'))
+MONGODB_MIN_POOL_SIZE = int(os.getenv('MONGODB_MIN_POOL_SIZE', '0'))
+MONGODB_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv('MONGODB_SERVER_SELECTION_TIMEOUT_MS', '5000'))
+# Comma-separated, in order of preference: zstd (needs zstandard), snappy (needs python-snappy), zlib
+MONGODB_COMPRESSORS = os.getenv('MONGODB_COMPRESSORS', 'zstd,snappy,zlib')
+MONGODB_READ_PREFERENCE = os.getenv('MONGODB_READ_PREFERENCE', 'primary')
+# Read-only reports and history pages can read from secondaries (MONGODB_SECONDARY_URI defaults to
+# MONGODB_URI). Staleness is bounded, and at least 90s, which is the server minimum
+MONGODB_SECONDARY_READS = os.getenv('MONGODB_SECONDARY_READS', '0') == '1'
+MONGODB_SECONDARY_URI = os.getenv('MONGODB_SECONDARY_URI', MONGODB_HOST)
+MONGODB_MAX_STALENESS_SECONDS = max(90, int(os.getenv('MONGODB_MAX_STALENESS_SECONDS', '90')))
+# Per-request Mongo query counting (X-Mongo-* headers in DEBUG, /kfc-admin/metrics/ otherwise)
+MONGO_SLOW_COMMAND_MS = float(os.getenv('MONGO_SLOW_COMMAND_MS', '100'))
 
 # Gemini AI
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY', '')
 
+# Seconds a discovered fallback Gemini model (or a failed client) is reused before retrying
+GEMINI_FALLBACK_TTL = float(os.getenv('GEMINI_FALLBACK_TTL', '600'))
+
+# Gemini call limits: per-call deadline, in-flight cap per process and circuit breaker
+GEMINI_TIMEOUT = float(os.getenv('GEMINI_TIMEOUT', '15'))
+GEMINI_MAX_CONCURRENCY = int(os.getenv('GEMINI_MAX_CONCURRENCY', '8'))
+GEMINI_QUEUE_TIMEOUT = float(os.getenv('GEMINI_QUEUE_TIMEOUT', '2'))
+GEMINI_BREAKER_THRESHOLD = int(os.getenv('GEMINI_BREAKER_THRESHOLD', '5'))
+GEMINI_BREAKER_RESET = float(os.getenv('GEMINI_BREAKER_RESET', '30'))
+
+# Gemini response cache: in-process LRU, optionally shared through Mongo. TTLs in seconds, 0 disables
+GEMINI_CACHE_SIZE = int(os.getenv('GEMINI_CACHE_SIZE', '512'))
+GEMINI_CACHE_MONGO = os.getenv('GEMINI_CACHE_MONGO', '0') == '1'
+GEMINI_CACHE_TTLS = {
+    'chat_about_menu': int(os.getenv('GEMINI_CACHE_TTL_MENU_CHAT', '600')),
+    'chat_about_system': int(os.getenv('GEMINI_CACHE_TTL_SYSTEM_CHAT', '3600')),
+    'generate_kfc_business_report': int(os.getenv('GEMINI_CACHE_TTL_REPORT', '900')),
+    'analyze_kfc_order': 0,
+    'generate_kfc_receipt': 0,
+}
+
+# Menu chat prompt: most relevant products sent to the model and their estimated token budget
+CHAT_CONTEXT_TOP_K = int(os.getenv('CHAT_CONTEXT_TOP_K', '12'))
+CHAT_CONTEXT_TOKEN_BUDGET = int(os.getenv('CHAT_CONTEXT_TOKEN_BUDGET', '600'))
+# Streamed menu-chat answers per process (each holds a worker thread) and their time limit
+CHAT_STREAM_MAX_CONCURRENCY = int(os.getenv('CHAT_STREAM_MAX_CONCURRENCY', '4'))
+CHAT_STREAM_MAX_SECONDS = float(os.getenv('CHAT_STREAM_MAX_SECONDS', '30'))
+
+# Background worker threads for AI enrichment jobs (order analysis, receipts)
+AI_WORKERS = int(os.getenv('AI_WORKERS', '4'))
+
+# Seconds between checks of the shared product catalog version
+CATALOG_VERSION_CHECK_INTERVAL = float(os.getenv('CATALOG_VERSION_CHECK_INTERVAL', '1'))
+
+# Live order status long-poll: how often the hub polls on standalone Mongo, how long one request
+# waits for a change, and how many requests may wait at once per process
+ORDER_STREAM_POLL_INTERVAL = float(os.getenv('ORDER_STREAM_POLL_INTERVAL', '2'))
+ORDER_LONG_POLL_SECONDS = float(os.getenv('ORDER_LONG_POLL_SECONDS', '20'))
+ORDER_LONG_POLL_MAX_WAITERS = int(os.getenv('ORDER_LONG_POLL_MAX_WAITERS', '8'))
+
+# Order status automation (delays: ORDER_DELAY_* and ORDER_DELAY_SPEED env vars)
+ORDER_SCHEDULER_AUTOSTART = os.getenv('ORDER_SCHEDULER_AUTOSTART', '1') == '1'
+
 # Auth redirects
 LOGIN_URL = '/accounts/login/'
 LOGIN_REDIRECT_URL = '/kfc-admin/dashboard/'
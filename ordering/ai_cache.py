@@ -0,0 +1,138 @@
+import datetime
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+from .models import AIResponse
+
+logger = logging.getLogger(__name__)
+
+_SPACE_RE = re.compile(r'\s+')
+
+
+def normalize_text(text):
+    """Lowercase, collapse whitespace and drop edge punctuation so "Hi!" and "hi" share a key."""
+    return _SPACE_RE.sub(' ', str(text or '')).strip().strip('?!.,').strip().lower()
+
+
+def make_key(method, model_name, question='', history=None, context=None):
+    """Stable hash of everything that shapes a Gemini answer."""
+    turns = []
+    for turn in (history or [])[-6:]:
+        try:
+            content = normalize_text(turn.get('content'))
+            if content:
+                turns.append([turn.get('role', 'user'), content])
+        except Exception:
+            pass
+    raw = json.dumps([method, model_name or '', normalize_text(question), turns, context],
+                     sort_keys=True, default=str, separators=(',', ':'))
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """LRU of generated text with per-method TTLs, backed by an optional shared Mongo
+    collection so every worker process benefits from one answer."""
+
+    def __init__(self, max_entries=512, ttls=None, use_mongo=False):
+        self.max_entries = max_entries
+        self.ttls = dict(ttls or {})
+        self.use_mongo = use_mongo
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.mongo_hits = 0
+        self.misses = 0
+        self.stores = 0
+
+    def ttl(self, method):
+        return self.ttls.get(method, 0)
+
+    def get(self, method, key):
+        if self.ttl(method) <= 0:
+            return None
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[1] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry:
+                del self._entries[key]
+        if self.use_mongo:
+            try:
+                doc = AIResponse._get_collection().find_one(
+                    {'_id': key, 'expires_at': {'$gt': datetime.datetime.utcnow()}}, {'text': 1, 'expires_at': 1})
+            except Exception:
+                logger.exception('AI response cache lookup failed')
+                doc = None
+            if doc and doc.get('text'):
+                remaining = (doc['expires_at'] - datetime.datetime.utcnow()).total_seconds()
+                self._remember(key, doc['text'], now + max(remaining, 0))
+                with self._lock:
+                    self.hits += 1
+                    self.mongo_hits += 1
+                return doc['text']
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, method, key, text):
+        ttl = self.ttl(method)
+        if ttl <= 0 or not text:
+            return
+        self._remember(key, text, time.time() + ttl)
+        with self._lock:
+            self.stores += 1
+        if self.use_mongo:
+            try:
+                AIResponse._get_collection().replace_one({'_id': key}, {
+                    '_id': key,
+                    'method': method,
+                    'text': text,
+                    'expires_at': datetime.datetime.utcnow() + datetime.timedelta(seconds=ttl),
+                }, upsert=True)
+            except Exception:
+                logger.exception('AI response cache store failed')
+
+    def _remember(self, key, text, expires):
+        with self._lock:
+            self._entries[key] = (text, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        if self.use_mongo:
+            try:
+                AIResponse.objects.delete()
+            except Exception:
+                logger.exception('AI response cache clear failed')
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'mongo_hits': self.mongo_hits,
+                'misses': self.misses,
+                'stores': self.stores,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else None,
+            }
+
+
+response_cache = ResponseCache(
+    max_entries=int(getattr(settings, 'GEMINI_CACHE_SIZE', 512)),
+    ttls=getattr(settings, 'GEMINI_CACHE_TTLS', {}),
+    use_mongo=bool(getattr(settings, 'GEMINI_CACHE_MONGO', False)),
+)
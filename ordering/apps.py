@@ -1,5 +1,63 @@
+import threading
+from importlib import import_module
+
 from django.apps import AppConfig
 from django.conf import settings
+from django.core.signals import request_started
+from pymongo.read_preferences import SecondaryPreferred, make_read_preference, read_pref_mode_from_name
+
+
+def _start_order_scheduler(**kwargs):
+    from .utils import order_scheduler
+    order_scheduler.start()
+
+
+def _warm_gemini(**kwargs):
+    # Build the shared Gemini client (and discover a fallback model) off the request path, once,
+    # when the process starts serving; management commands never pay for the network call
+    request_started.disconnect(dispatch_uid='kfc-gemini-warmup')
+    from .gemini_ai import get_gemini
+    threading.Thread(target=get_gemini, name='kfc-gemini-warmup', daemon=True).start()
+
+
+def _compressors():
+    """Configured wire compressors whose libraries are importable (zlib is always available)."""
+    modules = {'zstd': 'zstandard', 'snappy': 'snappy', 'zlib': 'zlib'}
+    usable = []
+    for name in (c.strip() for c in getattr(settings, 'MONGODB_COMPRESSORS', '').split(',')):
+        try:
+            import_module(modules[name])
+        except (KeyError, ImportError):
+            continue
+        usable.append(name)
+    return usable
+
+
+def _client_options():
+    options = {
+        'maxPoolSize': getattr(settings, 'MONGODB_MAX_POOL_SIZE', 50),
+        'minPoolSize': getattr(settings, 'MONGODB_MIN_POOL_SIZE', 0),
+        'serverSelectionTimeoutMS': getattr(settings, 'MONGODB_SERVER_SELECTION_TIMEOUT_MS', 5000),
+        'read_preference': make_read_preference(
+            read_pref_mode_from_name(getattr(settings, 'MONGODB_READ_PREFERENCE', 'primary')), None),
+    }
+    compressors = _compressors()
+    if compressors:
+        options['compressors'] = ','.join(compressors)
+    return options
+
+
+def register_primary_connection():
+    from mongoengine import register_connection
+    from .middleware import query_listener
+    register_connection(
+        alias=getattr(settings, 'MONGODB_ALIAS', 'default'),
+        host=getattr(settings, 'MONGODB_HOST', 'mongodb://localhost:27017/kfc_db'),
+        name=getattr(settings, 'MONGODB_NAME', 'kfc_db'),
+        event_listeners=[query_listener],
+        **_client_options(),
+    )
+
 
 class OrderingConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
@@ -7,9 +65,30 @@ class OrderingConfig(AppConfig):
 
     def ready(self):
         # Connect MongoEngine
+        register_primary_connection()
+        # Secondary-preferred alias for read-only reports and history pages (ordering.routing)
         from mongoengine import register_connection
-        register_connection(
-            alias=getattr(settings, 'MONGODB_ALIAS', 'default'),
-            host=getattr(settings, 'MONGODB_HOST', 'mongodb://localhost:27017/kfc_db'),
-            name=getattr(settings, 'MONGODB_NAME', 'kfc_db'),
-        )
+        from .middleware import query_listener
+        from .routing import READ_ALIAS, replica_reads_enabled
+        if replica_reads_enabled():
+            register_connection(
+                alias=READ_ALIAS,
+                host=getattr(settings, 'MONGODB_SECONDARY_URI', None) or getattr(settings, 'MONGODB_HOST', 'mongodb://localhost:27017/kfc_db'),
+                name=getattr(settings, 'MONGODB_NAME', 'kfc_db'),
+                event_listeners=[query_listener],
+                **dict(_client_options(), read_preference=SecondaryPreferred(
+                    max_staleness=max(90, int(getattr(settings, 'MONGODB_MAX_STALENESS_SECONDS', 90))))),
+            )
+        # Invalidate cached catalogs (menu, cart, chat matcher) whenever products change
+        from mongoengine import signals
+        from .models import Product
+        from .catalog import bump_catalog_version
+        if signals.signals_available:
+            signals.post_save.connect(bump_catalog_version, sender=Product)
+            signals.post_delete.connect(bump_catalog_version, sender=Product)
+        # Configure the shared Gemini client once per process instead of per request
+        request_started.connect(_warm_gemini, dispatch_uid='kfc-gemini-warmup')
+        # Resume order status automation once the process starts serving requests
+        # (not during management commands like migrate)
+        if getattr(settings, 'ORDER_SCHEDULER_AUTOSTART', True):
+            request_started.connect(_start_order_scheduler, dispatch_uid='kfc-order-scheduler')
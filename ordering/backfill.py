@@ -0,0 +1,94 @@
+import datetime
+import logging
+import re
+
+from pymongo import ReturnDocument, UpdateOne
+
+from .models import Customer, JobRun
+
+logger = logging.getLogger(__name__)
+
+JOB_NAME = 'customer_names'
+# A running job whose heartbeat is older than this is treated as crashed and may be taken over
+STALE_AFTER = datetime.timedelta(minutes=5)
+_PLACEHOLDER_RE = re.compile(r'^\s*(guest|customer)?\s*$', re.IGNORECASE)
+
+
+def _phone_names(coll):
+    """{phone: name} from customers with a real name, via one aggregation."""
+    pipeline = [
+        {'$match': {'phone': {'$nin': [None, '']}, 'name': {'$not': _PLACEHOLDER_RE}}},
+        {'$sort': {'_id': 1}},
+        {'$group': {'_id': '$phone', 'name': {'$last': '$name'}}},
+    ]
+    return {d['_id']: d['name'].strip() for d in coll.aggregate(pipeline, allowDiskUse=True)}
+
+
+def _new_name(doc, phone_names):
+    email = (doc.get('email') or '').strip()
+    if email and not email.endswith('@kfc.local') and '@' in email:
+        return email.split('@', 1)[0]
+    return phone_names.get(doc.get('phone')) or None
+
+
+def _claim(restart):
+    """Mark the job running and return its state, or None if another worker holds it."""
+    now = datetime.datetime.utcnow()
+    coll = JobRun._get_collection()
+    free = {'_id': JOB_NAME, '$or': [{'status': {'$ne': 'running'}}, {'heartbeat_at': {'$lt': now - STALE_AFTER}}]}
+    update = {'$set': {'status': 'running', 'heartbeat_at': now, 'error': None, 'finished_at': None}}
+    state = coll.find_one(free, {'status': 1})
+    if restart or not state or state.get('status') == 'done':
+        update['$set'].update({'last_id': None, 'processed': 0, 'updated': 0, 'started_at': now})
+    try:
+        return coll.find_one_and_update(free, update, upsert=True, return_document=ReturnDocument.AFTER)
+    except Exception:
+        # Lost the upsert race to another worker
+        return None
+
+
+def backfill_customer_names(batch_size=500, restart=False, progress=None):
+    """Give placeholder-named customers ("Guest", "Customer", blank) a real name from their
+    email or from another customer with the same phone. Resumes from the last finished batch.
+    progress, if given, is called with the job state after every batch."""
+    job = _claim(restart)
+    if job is None:
+        logger.info('Customer name backfill is already running')
+        return None
+    coll = Customer._get_collection()
+    runs = JobRun._get_collection()
+    last_id, processed, updated = job.get('last_id'), job.get('processed', 0), job.get('updated', 0)
+    try:
+        phone_names = _phone_names(coll)
+        while True:
+            query = {'name': _PLACEHOLDER_RE}
+            if last_id:
+                query['_id'] = {'$gt': last_id}
+            batch = list(coll.find(query, {'name': 1, 'email': 1, 'phone': 1}).sort('_id', 1).limit(batch_size))
+            if not batch:
+                break
+            ops = []
+            for doc in batch:
+                new_name = _new_name(doc, phone_names)
+                if new_name:
+                    # Guarded on the old name so a concurrent profile edit wins
+                    ops.append(UpdateOne({'_id': doc['_id'], 'name': doc['name']},
+                                         {'$set': {'name': new_name, 'name_lower': new_name.lower()}}))
+            if ops:
+                updated += coll.bulk_write(ops, ordered=False).modified_count
+            processed += len(batch)
+            last_id = batch[-1]['_id']
+            state = {'last_id': last_id, 'processed': processed, 'updated': updated,
+                     'heartbeat_at': datetime.datetime.utcnow()}
+            runs.update_one({'_id': JOB_NAME}, {'$set': state})
+            if progress:
+                progress(state)
+    except Exception as e:
+        runs.update_one({'_id': JOB_NAME}, {'$set': {'status': 'failed', 'error': str(e)[:500]}})
+        raise
+    runs.update_one({'_id': JOB_NAME}, {'$set': {'status': 'done', 'finished_at': datetime.datetime.utcnow()}})
+    return {'processed': processed, 'updated': updated}
+
+
+def backfill_status():
+    return JobRun.objects(name=JOB_NAME).first()
@@ -0,0 +1,78 @@
+import datetime
+import uuid
+
+from bson import ObjectId
+
+from .models import Cart
+
+SESSION_KEY = 'cart_id'
+
+
+def _cart_id(request, create=False):
+    """The caller's cart id. It is stored in the session once, on the first add, and the session
+    is not written again for later cart changes."""
+    cart_id = request.session.get(SESSION_KEY)
+    if not cart_id and create:
+        cart_id = uuid.uuid4().hex
+        request.session[SESSION_KEY] = cart_id
+    return cart_id
+
+
+def _migrate_session_cart(request):
+    """Move a cart kept in the session by older releases into the cart store."""
+    legacy = request.session.pop('cart', None)
+    if not legacy:
+        return
+    lines = {}
+    for pid, item in legacy.items():
+        try:
+            qty = int(item.get('quantity', 0))
+        except Exception:
+            continue
+        if qty > 0:
+            lines[pid] = qty
+    if lines:
+        set_lines(request, lines)
+
+
+def get_lines(request):
+    """{product_id: quantity} for the caller's cart."""
+    if 'cart' in request.session:
+        _migrate_session_cart(request)
+    cart_id = _cart_id(request)
+    if not cart_id:
+        return {}
+    doc = Cart._get_collection().find_one({'_id': cart_id}, {'lines': 1})
+    return {pid: int(qty) for pid, qty in ((doc or {}).get('lines') or {}).items() if qty and int(qty) > 0}
+
+
+def add_line(request, product_id, quantity):
+    """Atomically add quantity to one line."""
+    if not ObjectId.is_valid(str(product_id)):
+        return
+    Cart._get_collection().update_one(
+        {'_id': _cart_id(request, create=True)},
+        {'$inc': {f'lines.{product_id}': int(quantity)}, '$set': {'updated_at': datetime.datetime.utcnow()}},
+        upsert=True)
+
+
+def set_lines(request, quantities):
+    """Set several lines in one update; a quantity of 0 or less removes the line."""
+    if not quantities:
+        return
+    update = {'$set': {'updated_at': datetime.datetime.utcnow()}}
+    for pid, qty in quantities.items():
+        # Product ids become field names, so only ever accept ObjectId hex strings
+        if not ObjectId.is_valid(str(pid)):
+            continue
+        if int(qty) > 0:
+            update['$set'][f'lines.{pid}'] = int(qty)
+        else:
+            update.setdefault('$unset', {})[f'lines.{pid}'] = ''
+    Cart._get_collection().update_one({'_id': _cart_id(request, create=True)}, update, upsert=True)
+
+
+def clear(request):
+    cart_id = _cart_id(request)
+    if cart_id:
+        Cart._get_collection().delete_one({'_id': cart_id})
@@ -0,0 +1,132 @@
+import threading
+import time
+from datetime import datetime
+
+from bson import ObjectId
+from django.conf import settings
+from pymongo import ReturnDocument
+
+from .matching import ProductMatcher
+from .search import SearchIndex
+from .models import CatalogVersion, Product
+
+
+class CatalogSnapshot:
+    """Immutable view of every product at one catalog version."""
+
+    def __init__(self, version, products):
+        self.version = version
+        self.products = sorted(products, key=lambda p: p.created_at or datetime.min, reverse=True)
+        self.by_id = {str(p.id): p for p in self.products}
+        self.available = [p for p in self.products if p.is_available]
+        self.by_category = {}
+        for p in self.available:
+            self.by_category.setdefault(p.category, []).append(p)
+        self._matcher = None
+        self._search_index = None
+        # The lazy indexes take up to a second to build on large menus; build each one once
+        self._build_lock = threading.Lock()
+
+    def get(self, product_id):
+        return self.by_id.get(str(product_id))
+
+    def category(self, name):
+        return self.by_category.get(name, [])
+
+    @property
+    def matcher(self):
+        if self._matcher is None:
+            with self._build_lock:
+                if self._matcher is None:
+                    self._matcher = ProductMatcher((pid, p.name) for pid, p in self.by_id.items())
+        return self._matcher
+
+    @property
+    def search_index(self):
+        """Full-text index over available products, newest first on equal relevance."""
+        if self._search_index is None:
+            with self._build_lock:
+                if self._search_index is None:
+                    self._search_index = SearchIndex(
+                        (str(p.id), {'name': p.name, 'category': p.category, 'description': p.description})
+                        for p in self.available)
+        return self._search_index
+
+
+class CatalogCache:
+    """Process-local product catalog, reloaded only when the shared version in Mongo moves.
+    The version itself is re-read at most once per check_interval seconds."""
+
+    def __init__(self, check_interval=1.0):
+        self.check_interval = check_interval
+        self._snapshot = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _shared_version(self):
+        doc = CatalogVersion._get_collection().find_one({'_id': 'catalog'}, {'version': 1})
+        return doc.get('version', 0) if doc else 0
+
+    def get(self):
+        snap = self._snapshot
+        now = time.monotonic()
+        if snap is not None and now - self._checked_at < self.check_interval:
+            self.hits += 1
+            return snap
+        version = self._shared_version()
+        self._checked_at = now
+        if snap is not None and snap.version == version:
+            self.hits += 1
+            return snap
+        with self._lock:
+            snap = self._snapshot
+            if snap is None or snap.version != version:
+                snap = CatalogSnapshot(version, list(Product.objects()))
+                self._snapshot = snap
+                self.misses += 1
+            else:
+                self.hits += 1
+        return snap
+
+    def bump(self):
+        doc = CatalogVersion._get_collection().find_one_and_update(
+            {'_id': 'catalog'}, {'$inc': {'version': 1}}, upsert=True, return_document=ReturnDocument.AFTER)
+        # Force the next get() in this process to compare versions straight away
+        self._checked_at = 0.0
+        return doc['version']
+
+    def stats(self):
+        snap = self._snapshot
+        total = self.hits + self.misses
+        return {
+            'version': snap.version if snap else None,
+            'products': len(snap.by_id) if snap else 0,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / total, 4) if total else None,
+        }
+
+
+catalog_cache = CatalogCache(check_interval=float(getattr(settings, 'CATALOG_VERSION_CHECK_INTERVAL', 1.0)))
+
+
+def get_catalog():
+    return catalog_cache.get()
+
+
+def stock_levels(product_ids):
+    """Live {product_id: stock_quantity} for a few products. Stock moves with every order without
+    bumping the catalog version, so snapshot stock counts are only a hint; read these instead."""
+    ids = [ObjectId(pid) for pid in product_ids if ObjectId.is_valid(str(pid))]
+    if not ids:
+        return {}
+    return {str(p['_id']): int(p.get('stock_quantity') or 0)
+            for p in Product._get_collection().find({'_id': {'$in': ids}}, {'stock_quantity': 1})}
+
+
+def bump_catalog_version(*args, **kwargs):
+    """Invalidate every process's catalog; connected to Product save/delete signals and called when
+    checkout sells out (or restocks) a product. Plain stock decrements do not bump it."""
+    return catalog_cache.bump()
@@ -1,17 +1,208 @@
 import os
+import threading
+import time
 from django.conf import settings
 import logging
 
+from .ai_cache import response_cache, make_key
+
 try:
     import google.generativeai as genai
 except Exception:  # package may not be installed yet
     genai = None
 
+_client = None
+_client_lock = threading.Lock()
+# Model picked by list_models() discovery, shared until it expires
+_fallback = {'model': None, 'expires': 0.0}
+_fallback_lock = threading.Lock()
+
+
+def _float_setting(name, default):
+    try:
+        return float(getattr(settings, name, default))
+    except Exception:
+        return float(default)
+
+
+class CircuitBreaker:
+    """Opens after `threshold` consecutive failures so callers go straight to their fallbacks.
+    After `reset_after` seconds one probe call is let through (half-open); its outcome
+    closes the breaker or opens it again."""
+
+    def __init__(self, threshold=5, reset_after=30.0):
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == 'closed':
+                return True
+            if self.state == 'open':
+                if time.monotonic() - self.opened_at < self.reset_after:
+                    return False
+                self.state = 'half_open'
+                self._probing = False
+            if self._probing:
+                return False
+            self._probing = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.state = 'closed'
+            self.failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.state == 'half_open' or (self.state == 'closed' and self.failures >= self.threshold):
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+                self.times_opened += 1
+
+    def release(self):
+        """Give back an allowed call that never reached the model."""
+        with self._lock:
+            self._probing = False
+
+    def snapshot(self):
+        with self._lock:
+            return {'state': self.state, 'consecutive_failures': self.failures, 'times_opened': self.times_opened}
+
+
+breaker = CircuitBreaker(
+    threshold=int(_float_setting('GEMINI_BREAKER_THRESHOLD', 5)),
+    reset_after=_float_setting('GEMINI_BREAKER_RESET', 30),
+)
+# Caps in-flight model calls per process so a slow provider cannot hold every worker thread
+_call_slots = threading.BoundedSemaphore(max(1, int(_float_setting('GEMINI_MAX_CONCURRENCY', 8))))
+_stats_lock = threading.Lock()
+_call_stats = {'calls': 0, 'succeeded': 0, 'failed': 0, 'timed_out': 0, 'rejected': 0,
+               'short_circuited': 0, 'in_flight': 0, 'total_ms': 0.0, 'max_ms': 0.0}
+
+
+def _count(**deltas):
+    with _stats_lock:
+        for name, value in deltas.items():
+            _call_stats[name] += value
+
+
+def _begin_call():
+    """Admit a call through the breaker and the concurrency cap; returns its start time or None."""
+    if not breaker.allow():
+        _count(short_circuited=1)
+        return None
+    if not _call_slots.acquire(timeout=_float_setting('GEMINI_QUEUE_TIMEOUT', 2)):
+        breaker.release()
+        _count(rejected=1)
+        return None
+    _count(calls=1, in_flight=1)
+    return time.monotonic()
+
+
+def _end_call(started, error=None):
+    _call_slots.release()
+    if error is None:
+        breaker.record_success()
+        _count(succeeded=1)
+    else:
+        breaker.record_failure()
+        name = type(error).__name__.lower()
+        _count(failed=1, timed_out=int('deadline' in name or 'timeout' in name))
+        if getattr(settings, 'DEBUG', False):
+            logging.getLogger(__name__).error('Gemini call failed: %r', error)
+    elapsed = (time.monotonic() - started) * 1000
+    with _stats_lock:
+        _call_stats['in_flight'] -= 1
+        _call_stats['total_ms'] += elapsed
+        _call_stats['max_ms'] = max(_call_stats['max_ms'], elapsed)
+
+
+def _request_options():
+    return {'timeout': _float_setting('GEMINI_TIMEOUT', 15)}
+
+
+def guarded_call(fn, *args, **kwargs):
+    """Run a Gemini SDK call behind the breaker, the concurrency cap and a per-call deadline.
+    Returns the SDK result, or None when the call was skipped or failed."""
+    started = _begin_call()
+    if started is None:
+        return None
+    kwargs.setdefault('request_options', _request_options())
+    try:
+        result = fn(*args, **kwargs)
+    except Exception as e:
+        _end_call(started, e)
+        return None
+    _end_call(started)
+    return result
+
+
+def guarded_stream(fn, *args, **kwargs):
+    """Streaming counterpart of guarded_call: yields response chunks while holding a call slot.
+    Yields nothing when the call is not admitted; errors are recorded and re-raised."""
+    started = _begin_call()
+    if started is None:
+        return
+    kwargs.setdefault('request_options', _request_options())
+    error = None
+    try:
+        for chunk in fn(*args, stream=True, **kwargs):
+            yield chunk
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        _end_call(started, error)
+
+
+def gemini_metrics():
+    with _stats_lock:
+        stats = dict(_call_stats)
+    finished = stats['succeeded'] + stats['failed']
+    stats['avg_ms'] = round(stats.pop('total_ms') / finished, 1) if finished else None
+    stats['max_ms'] = round(stats['max_ms'], 1)
+    stats['breaker'] = breaker.snapshot()
+    return stats
+
+
+def _fallback_ttl():
+    try:
+        return float(getattr(settings, 'GEMINI_FALLBACK_TTL', 600))
+    except Exception:
+        return 600.0
+
+
+def get_gemini():
+    """Process-wide KFCGeminiAI shared by every request and background job.
+    A client left without a model despite having an API key is rebuilt after GEMINI_FALLBACK_TTL."""
+    global _client
+    client = _client
+    if client is None or client.is_stale():
+        with _client_lock:
+            if _client is None or _client.is_stale():
+                _client = KFCGeminiAI()
+            client = _client
+    return client
+
+
 class KFCGeminiAI:
     def __init__(self):
         api_key = os.getenv('GEMINI_API_KEY') or getattr(settings, 'GEMINI_API_KEY', '')
         model_name = os.getenv('GEMINI_MODEL') or getattr(settings, 'GEMINI_MODEL', 'gemini-1.5-flash')
         self.model = None
+        self.model_name = model_name
+        self._has_key = bool(genai and api_key)
+        self._built_at = time.monotonic()
         if genai and api_key:
             try:
                 genai.configure(api_key=api_key)
@@ -28,7 +219,19 @@ class KFCGeminiAI:
                     logging.getLogger(__name__).exception('Failed to configure Gemini client: %s', e)
                 self.model = None
 
+    def is_stale(self):
+        return self.model is None and self._has_key and time.monotonic() - self._built_at > _fallback_ttl()
+
     def _fallback_model(self):
+        """Discovered fallback model, cached (even when none was found) for GEMINI_FALLBACK_TTL."""
+        with _fallback_lock:
+            now = time.monotonic()
+            if now >= _fallback['expires']:
+                _fallback['model'] = self._discover_fallback_model()
+                _fallback['expires'] = now + _fallback_ttl()
+            return _fallback['model']
+
+    def _discover_fallback_model(self):
         try:
             models = list(genai.list_models())
             # Filter models that support text generation
@@ -80,19 +283,30 @@ class KFCGeminiAI:
         except Exception:
             return None
 
-    def _safe_generate(self, prompt, fallback):
+    def _cache_key(self, method, question='', history=None, context=None):
+        """Response cache key, or None when caching is off for this method."""
+        if response_cache.ttl(method) <= 0:
+            return None
+        model_name = getattr(self.model, 'model_name', None) or self.model_name
+        return make_key(method, model_name, question, history, context)
+
+    def _safe_generate(self, prompt, fallback, method=None, cache_key=None):
+        if cache_key:
+            cached = response_cache.get(method, cache_key)
+            if cached is not None:
+                return cached
         if not self.model:
             return fallback
-        try:
-            resp = self.model.generate_content(prompt)
-            text = self._extract_text(resp)
-            if not text and getattr(settings, 'DEBUG', False):
-                logging.getLogger(__name__).warning('Gemini response had no text; using fallback. Raw: %s', getattr(resp, 'candidates', None))
-            return text or fallback
-        except Exception as e:
-            if getattr(settings, 'DEBUG', False):
-                logging.getLogger(__name__).exception('Gemini generate_content failed: %s', e)
+        resp = guarded_call(self.model.generate_content, prompt)
+        if resp is None:
             return fallback
+        text = self._extract_text(resp)
+        if not text and getattr(settings, 'DEBUG', False):
+            logging.getLogger(__name__).warning('Gemini response had no text; using fallback. Raw: %s', getattr(resp, 'candidates', None))
+        if text and cache_key:
+            # Fallbacks are never cached so a recovered model is used straight away
+            response_cache.set(method, cache_key, text)
+        return text or fallback
 
     def _tidy(self, text, max_chars=800):
         try:
@@ -120,6 +334,8 @@ class KFCGeminiAI:
         result = self._safe_generate(prompt, "KFC Order Analysis: Order processed successfully.")
         return self._tidy(result, max_chars=600)
 
+    RECEIPT_FALLBACK = "Thank you for choosing KFC! Your order is being prepared with care."
+
     def generate_kfc_receipt(self, order_data):
         prompt = f"""
         Create a concise, warm receipt summary in PLAIN TEXT (no markdown/emojis), max 120 words.
@@ -130,7 +346,7 @@ class KFCGeminiAI:
         Total: <amount>
         Note: A short friendly thank-you add come back sugestion
         """
-        result = self._safe_generate(prompt, "Thank you for choosing KFC! Your order is being prepared with care.")
+        result = self._safe_generate(prompt, self.RECEIPT_FALLBACK)
         return self._tidy(result, max_chars=700)
 
     def generate_kfc_business_report(self, sales_data, period='weekly'):
@@ -144,7 +360,8 @@ class KFCGeminiAI:
         Risks: <1 line>
         Actions: <3 short bullets>
         """
-        result = self._safe_generate(prompt, "KFC Business Report: Data analysis unavailable.")
+        key = self._cache_key('generate_kfc_business_report', context=[period, sales_data])
+        result = self._safe_generate(prompt, "KFC Business Report: Data analysis unavailable.", 'generate_kfc_business_report', key)
         return self._tidy(result, max_chars=900)
 
     def chat_about_system(self, question, history=None):
@@ -176,14 +393,11 @@ class KFCGeminiAI:
         User: {question}
         Assistant: """
         fallback = "I'm here to help with the KFC ordering system. Please rephrase your question."
-        result = self._safe_generate(prompt, fallback)
+        key = self._cache_key('chat_about_system', question, history)
+        result = self._safe_generate(prompt, fallback, 'chat_about_system', key)
         return self._tidy(result, max_chars=900)
 
-    def chat_about_menu(self, question, catalog, history=None):
-        """
-        Strictly answer about available products, their categories, and prices using the provided catalog.
-        catalog: list of dicts with keys: name, category, price (number)
-        """
+    def _menu_prompt(self, question, catalog, history=None, summary=None):
         sys_rules = (
             "You are a friendly, concise KFC menu assistant. "
             "Only answer about the provided products, categories, and prices. "
@@ -208,7 +422,8 @@ class KFCGeminiAI:
                 except Exception:
                     ptxt = str(p)
                 if n:
-                    lines.append(f"- {n} [{c}] - ${ptxt}")
+                    sold_out = ' (sold out)' if item.get('in_stock') is False else ''
+                    lines.append(f"- {n} [{c}] - ${ptxt}{sold_out}")
             catalog_text = "\n".join(lines)
         except Exception:
             catalog_text = ""
@@ -227,7 +442,10 @@ class KFCGeminiAI:
         prompt = f"""
         {sys_rules}
 
-        Catalog (available items):
+        {"Menu categories:" if summary else ""}
+        {summary or ""}
+
+        {"Items most relevant to this question:" if summary else "Catalog (available items):"}
         {catalog_text}
 
         Conversation so far:
@@ -235,6 +453,67 @@ class KFCGeminiAI:
 
         User: {question}
         Assistant: """
-        fallback = "I can help with available KFC products and prices only. Please ask about items on the menu."
-        result = self._safe_generate(prompt, fallback)
+        return prompt
+
+    MENU_FALLBACK = "I can help with available KFC products and prices only. Please ask about items on the menu."
+
+    def chat_about_menu(self, question, catalog, history=None, summary=None):
+        """
+        Strictly answer about available products, their categories, and prices using the provided catalog.
+        catalog: list of dicts with keys: name, category, price (number), optional in_stock
+        summary: optional per-category overview when catalog is only a relevant subset (see menu_context)
+        The cache key hashes exactly the products and summary in the prompt, so catalog changes
+        that do not reach the prompt (stock counts, unrelated products) keep the answer cached.
+        """
+        key = self._cache_key('chat_about_menu', question, history, [catalog, summary])
+        prompt = self._menu_prompt(question, catalog, history, summary)
+        result = self._safe_generate(prompt, self.MENU_FALLBACK, 'chat_about_menu', key)
         return self._tidy(result, max_chars=700)
+
+    def chat_about_menu_stream(self, question, catalog, history=None, summary=None, max_chars=700, max_seconds=None):
+        """
+        Same answer as chat_about_menu, yielded in text chunks as the model produces them.
+        Cached answers and fallbacks arrive as a single chunk. max_seconds cuts a slow answer short
+        (marked with an ellipsis and not cached) so the request does not hold its worker thread for long.
+        """
+        key = self._cache_key('chat_about_menu', question, history, [catalog, summary])
+        if key:
+            cached = response_cache.get('chat_about_menu', key)
+            if cached is not None:
+                yield self._tidy(cached, max_chars=max_chars)
+                return
+        if not self.model:
+            yield self.MENU_FALLBACK
+            return
+        parts = []
+        size = 0
+        completed = False
+        deadline = time.monotonic() + max_seconds if max_seconds else None
+        try:
+            stream = guarded_stream(self.model.generate_content, self._menu_prompt(question, catalog, history, summary))
+            for resp in stream:
+                if deadline and parts and time.monotonic() > deadline:
+                    yield '…'
+                    stream.close()
+                    break
+                text = self._extract_text(resp)
+                if not text:
+                    continue
+                if not parts:
+                    text = text.lstrip()
+                if size + len(text) >= max_chars:
+                    yield text[:max(0, max_chars - 1 - size)].rstrip() + '…'
+                    parts.append(text)
+                    stream.close()
+                    break
+                size += len(text)
+                parts.append(text)
+                yield text
+            else:
+                completed = bool(parts)
+        except Exception:
+            pass
+        if not parts:
+            yield self.MENU_FALLBACK
+        elif completed and key:
+            response_cache.set('chat_about_menu', key, ''.join(parts))
@@ -0,0 +1,89 @@
+import io
+import logging
+
+from mongoengine.fields import GridFSProxy
+
+from .catalog import bump_catalog_version
+from .models import Product
+
+try:
+    from PIL import Image, ImageOps
+except Exception:  # Pillow is optional; originals are served when it is missing
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+# Longest edge in pixels for each derivative
+VARIANT_SIZES = {'thumb': 160, 'card': 480, 'full': 1200}
+AVATAR_SIZES = {'thumb': 96, 'card': 320}
+VARIANT_FORMAT = ('WEBP', 'image/webp', 'webp')
+
+
+def render_variants(data, sizes):
+    """Resize raw image bytes into {name: bytes} WebP derivatives."""
+    if Image is None:
+        return {}
+    fmt, _, _ = VARIANT_FORMAT
+    src = Image.open(io.BytesIO(data))
+    src = ImageOps.exif_transpose(src)
+    if src.mode not in ('RGB', 'RGBA'):
+        src = src.convert('RGBA' if 'A' in src.getbands() else 'RGB')
+    out = {}
+    for name, edge in sizes.items():
+        img = src.copy()
+        img.thumbnail((edge, edge))
+        buf = io.BytesIO()
+        img.save(buf, fmt, quality=80, method=4)
+        out[name] = buf.getvalue()
+    return out
+
+
+def variant_proxy(original, variants, size):
+    """GridFS proxy for a stored derivative, falling back to the original file."""
+    grid_id = (variants or {}).get(size) if size else None
+    if not grid_id:
+        return original
+    return GridFSProxy(grid_id=grid_id, db_alias=original.db_alias, collection_name=original.collection_name)
+
+
+def delete_variants(original, variants):
+    for grid_id in (variants or {}).values():
+        try:
+            variant_proxy(original, {'x': grid_id}, 'x').delete()
+        except Exception:
+            pass
+
+
+def generate_variants(document_cls, doc_id, field='image', variants_field='image_variants', sizes=None):
+    """Build and store derivatives for document_cls.<field>, replacing any previous set.
+    The write is guarded on the original's grid id so a newer upload is never overwritten."""
+    sizes = sizes or VARIANT_SIZES
+    doc = document_cls.objects(id=doc_id).only(field, variants_field).first()
+    original = getattr(doc, field, None) if doc else None
+    grid_id = getattr(original, 'grid_id', None)
+    if not grid_id:
+        return {}
+    try:
+        rendered = render_variants(original.read(), sizes)
+    except Exception:
+        logger.exception('Could not render image variants for %s %s', document_cls.__name__, doc_id)
+        return {}
+    if not rendered:
+        return {}
+    _, content_type, ext = VARIANT_FORMAT
+    stored = {}
+    for name, data in rendered.items():
+        proxy = GridFSProxy(db_alias=original.db_alias, collection_name=original.collection_name)
+        proxy.put(data, content_type=content_type, filename=f'{grid_id}-{name}.{ext}')
+        stored[name] = proxy.grid_id
+    db_field = document_cls._fields[field].db_field
+    db_variants = document_cls._fields[variants_field].db_field
+    result = document_cls._get_collection().update_one(
+        {'_id': doc.id, db_field: grid_id}, {'$set': {db_variants: stored}})
+    if not result.matched_count:
+        delete_variants(original, stored)
+        return {}
+    delete_variants(original, getattr(doc, variants_field, None))
+    if document_cls is Product:
+        bump_catalog_version()
+    return stored
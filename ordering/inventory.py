@@ -0,0 +1,107 @@
+import logging
+
+from bson import ObjectId
+from pymongo.errors import PyMongoError
+
+from .catalog import bump_catalog_version
+from .models import Product
+
+logger = logging.getLogger(__name__)
+
+
+# A catalog snapshot only changes when a product goes on or off the menu, so stock moves use
+# plain $inc updates and bump the catalog version only on the one write that flips availability.
+_TRIES = 3
+
+
+def _take(coll, oid, qty):
+    """Take qty of one product. Returns (taken, sold_out): taken is False when stock ran short;
+    sold_out is True when this write took the last of it and marked the product unavailable."""
+    for _ in range(_TRIES):
+        if coll.update_one({'_id': oid, 'stock_quantity': {'$gt': qty}}, {'$inc': {'stock_quantity': -qty}}).matched_count:
+            return True, False
+        if coll.update_one({'_id': oid, 'stock_quantity': qty},
+                           {'$set': {'stock_quantity': 0, 'is_available': False}}).matched_count:
+            return True, True
+        # Neither matched: either stock really is short, or it moved between the two updates
+        doc = coll.find_one({'_id': oid}, {'stock_quantity': 1})
+        if not doc or int(doc.get('stock_quantity') or 0) < qty:
+            break
+    return False, False
+
+
+def _give_back(coll, oid, qty, was_available):
+    """Return qty of one product. Returns True when the product comes back onto the menu."""
+    if coll.update_one({'_id': oid, 'stock_quantity': {'$gt': 0}}, {'$inc': {'stock_quantity': qty}}).matched_count:
+        return False
+    update = {'$inc': {'stock_quantity': qty}}
+    if was_available:
+        update['$set'] = {'is_available': True}
+    return bool(coll.update_one({'_id': oid}, update).matched_count and was_available)
+
+
+def _wanted_quantities(items):
+    wanted, names, errors = {}, {}, []
+    for it in items:
+        try:
+            oid = ObjectId(it['product_id'])
+        except Exception:
+            errors.append(f"Product not found: {it.get('name')}")
+            continue
+        wanted[oid] = wanted.get(oid, 0) + int(it['quantity'])
+        names[oid] = it.get('name')
+    return wanted, names, errors
+
+
+def release_stock(reservation):
+    """Return stock taken by reserve_stock (e.g. when the order could not be saved)."""
+    if not reservation:
+        return
+    coll = Product._get_collection()
+    restocked = [_give_back(coll, oid, qty, was_available) for oid, (qty, was_available) in reservation.items()]
+    if any(restocked):
+        bump_catalog_version()
+
+
+def reserve_stock(items):
+    """Take stock for every cart line, or for none of them.
+    items: [{'product_id', 'name', 'quantity'}]
+    Returns (reservation, errors); reservation is only set when errors is empty
+    and can be handed to release_stock to undo it."""
+    wanted, names, errors = _wanted_quantities(items)
+    coll = Product._get_collection()
+    current = {p['_id']: p for p in coll.find(
+        {'_id': {'$in': list(wanted)}}, {'name': 1, 'stock_quantity': 1, 'is_available': 1})}
+    for oid, qty in wanted.items():
+        p = current.get(oid)
+        if not p:
+            errors.append(f"Product not found: {names[oid]}")
+        elif int(p.get('stock_quantity') or 0) < qty:
+            errors.append(f"Not enough stock for {p.get('name')} (have {int(p.get('stock_quantity') or 0)}, need {qty})")
+    if errors:
+        return None, errors
+    if not wanted:
+        return {}, []
+
+    # Each update only matches while enough stock remains, so a lost race shows up as a
+    # line that could not be taken and the lines already taken are given back
+    reservation = {}
+    sold_out = False
+    try:
+        for oid, qty in wanted.items():
+            taken, emptied = _take(coll, oid, qty)
+            if not taken:
+                release_stock(reservation)
+                return None, [f"Not enough stock for {current[oid].get('name') or names[oid]}"]
+            reservation[oid] = (qty, current[oid].get('is_available', True))
+            sold_out = sold_out or emptied
+    except PyMongoError:
+        logger.exception('Stock reservation failed')
+        try:
+            release_stock(reservation)
+        except PyMongoError:
+            logger.exception('Could not give back reserved stock %s', reservation)
+        return None, ['Could not reserve stock right now, please try again.']
+    if sold_out:
+        bump_catalog_version()
+    return reservation, []
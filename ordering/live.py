@@ -0,0 +1,119 @@
+import logging
+import queue
+import threading
+import time
+
+from django.conf import settings
+from pymongo.errors import OperationFailure, PyMongoError
+
+from .models import Order
+
+logger = logging.getLogger(__name__)
+
+STATUS_FIELDS = {'order_number': 1, 'status': 1, 'updated_at': 1, 'gemini_analysis': 1}
+
+
+def order_payload(doc):
+    """JSON-friendly status snapshot from a raw kfc_orders document."""
+    updated_at = doc.get('updated_at')
+    return {
+        'order_number': doc.get('order_number'),
+        'status': doc.get('status'),
+        'updated_at': updated_at.isoformat() if updated_at else None,
+        'gemini_analysis': doc.get('gemini_analysis') or None,
+    }
+
+
+class OrderStatusHub:
+    """One watcher thread per process that fans order updates out to waiting long-polls.
+    Uses a change stream when Mongo is a replica set and falls back to polling the
+    subscribed orders on standalone servers."""
+
+    def __init__(self, poll_interval=2.0):
+        self.poll_interval = poll_interval
+        self.mode = None
+        self._subs = {}
+        self._last = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def subscribe(self, order_number):
+        q = queue.Queue(maxsize=20)
+        with self._lock:
+            self._subs.setdefault(order_number, set()).add(q)
+            if not (self._thread and self._thread.is_alive()):
+                self._thread = threading.Thread(target=self._run, name='kfc-order-hub', daemon=True)
+                self._thread.start()
+        return q
+
+    def unsubscribe(self, order_number, q):
+        with self._lock:
+            subs = self._subs.get(order_number)
+            if subs:
+                subs.discard(q)
+                if not subs:
+                    self._subs.pop(order_number, None)
+                    self._last.pop(order_number, None)
+
+    def publish(self, payload):
+        number = payload.get('order_number')
+        with self._lock:
+            if self._last.get(number) == payload:
+                return
+            self._last[number] = payload
+            targets = list(self._subs.get(number, ()))
+        for q in targets:
+            try:
+                q.put_nowait(payload)
+            except queue.Full:
+                pass
+
+    def _run(self):
+        while True:
+            try:
+                self._watch()
+            except OperationFailure as e:
+                # Standalone servers do not support change streams
+                logger.info('Order change stream unavailable (%s); polling instead', e)
+                self._poll()
+            except PyMongoError:
+                logger.exception('Order change stream failed; reconnecting')
+                time.sleep(self.poll_interval)
+            except Exception:
+                logger.exception('Order change stream unusable; polling instead')
+                self._poll()
+
+    def _watch(self):
+        pipeline = [{'$match': {
+            'operationType': {'$in': ['update', 'replace']},
+            '$or': [
+                {'updateDescription.updatedFields.status': {'$exists': True}},
+                {'updateDescription.updatedFields.gemini_analysis': {'$exists': True}},
+                {'operationType': 'replace'},
+            ],
+        }}]
+        with Order._get_collection().watch(pipeline, full_document='updateLookup') as stream:
+            self.mode = 'change_stream'
+            for change in stream:
+                doc = change.get('fullDocument')
+                if doc and doc.get('order_number') in self._subs:
+                    self.publish(order_payload(doc))
+
+    def _poll(self):
+        self.mode = 'polling'
+        coll = Order._get_collection()
+        while True:
+            numbers = list(self._subs)
+            if numbers:
+                try:
+                    for doc in coll.find({'order_number': {'$in': numbers}}, STATUS_FIELDS):
+                        self.publish(order_payload(doc))
+                except PyMongoError:
+                    logger.exception('Order status poll failed')
+            time.sleep(self.poll_interval)
+
+
+order_hub = OrderStatusHub(poll_interval=float(getattr(settings, 'ORDER_STREAM_POLL_INTERVAL', 2.0)))
+# Long-polls waiting at once in this process; the rest are answered straight away so waiting
+# pages can never take every WSGI worker thread
+long_poll_slots = threading.BoundedSemaphore(int(getattr(settings, 'ORDER_LONG_POLL_MAX_WAITERS', 8)))
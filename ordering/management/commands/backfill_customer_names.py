@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from ordering.backfill import backfill_customer_names
+
+
+class Command(BaseCommand):
+    help = 'Replace placeholder customer names using real emails or a named customer with the same phone. Resumable.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--restart', action='store_true', help='Ignore saved progress and scan every customer again.')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        def progress(state):
+            self.stdout.write(f"Processed {state['processed']} customers, renamed {state['updated']}.")
+
+        result = backfill_customer_names(batch_size=options['batch_size'], restart=options['restart'], progress=progress)
+        if result is None:
+            self.stdout.write(self.style.WARNING('Backfill is already running in another process.'))
+            return
+        self.stdout.write(self.style.SUCCESS(f"Done: processed {result['processed']} customers, renamed {result['updated']}."))
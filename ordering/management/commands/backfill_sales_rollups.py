@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from ordering.rollups import reset_rollups, rollup_completed_orders
+
+
+class Command(BaseCommand):
+    help = 'Fold completed orders into the daily sales rollups used by admin analytics.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true', help='Drop existing rollups and recount every completed order.')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            reset_rollups()
+            self.stdout.write('Cleared existing rollups.')
+        count = rollup_completed_orders(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Rolled up {count} completed orders.'))
@@ -0,0 +1,61 @@
+import random
+import time
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from django.core.management.base import BaseCommand
+
+from ordering.catalog import CatalogSnapshot
+from ordering.gemini_ai import KFCGeminiAI
+from ordering.menu_context import estimate_tokens, menu_context, menu_item
+from ordering.models import Product
+
+WORDS = ['crispy', 'spicy', 'zinger', 'original', 'hot', 'wings', 'tenders', 'bucket', 'wrap', 'twister',
+         'fries', 'coleslaw', 'corn', 'gravy', 'pepsi', 'lemonade', 'sundae', 'brownie', 'family', 'combo']
+CATEGORIES = list(Product.category.choices)
+QUESTIONS = ['hi', 'what spicy chicken do you have?', 'cheapest drinks', 'family bucket under $20']
+
+
+def synthetic_catalog(size, seed=7):
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+    products = []
+    for i in range(size):
+        name = ' '.join(rng.sample(WORDS, 3)).title() + f' {i}'
+        products.append(Product(
+            id=ObjectId(), name=name, category=rng.choice(CATEGORIES), price=round(rng.uniform(1, 25), 2),
+            description=' '.join(rng.sample(WORDS, 6)), is_available=rng.random() > 0.1,
+            created_at=now - timedelta(minutes=i)))
+    return CatalogSnapshot(0, products)
+
+
+class Command(BaseCommand):
+    help = 'Compare menu-chat prompt size and build time for the full catalog vs the relevance-pruned context.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='25,100,500,2000', help='Comma-separated synthetic catalog sizes.')
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        ai = KFCGeminiAI.__new__(KFCGeminiAI)  # prompt building only; no client needed
+        self.stdout.write(f"{'products':>8} {'full tokens':>12} {'pruned tokens':>14} {'full ms':>8} {'pruned ms':>10}")
+        for size in [int(s) for s in options['sizes'].split(',') if s.strip()]:
+            catalog = synthetic_catalog(size)
+            catalog.search_index  # built once per catalog version in production, so keep it out of the timings
+            full_tokens = pruned_tokens = 0
+            full_time = pruned_time = 0.0
+            for _ in range(options['repeat']):
+                for question in QUESTIONS:
+                    started = time.perf_counter()
+                    prompt = ai._menu_prompt(question, [menu_item(p) for p in catalog.products])
+                    full_time += time.perf_counter() - started
+                    full_tokens += estimate_tokens(prompt)
+
+                    started = time.perf_counter()
+                    items, summary = menu_context(catalog, question)
+                    prompt = ai._menu_prompt(question, items, summary=summary)
+                    pruned_time += time.perf_counter() - started
+                    pruned_tokens += estimate_tokens(prompt)
+            runs = options['repeat'] * len(QUESTIONS)
+            self.stdout.write(f'{size:>8} {full_tokens // runs:>12} {pruned_tokens // runs:>14} '
+                              f'{full_time / runs * 1000:>8.2f} {pruned_time / runs * 1000:>10.2f}')
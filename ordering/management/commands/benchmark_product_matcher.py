@@ -0,0 +1,76 @@
+import random
+import re
+import time
+
+from django.core.management.base import BaseCommand
+
+from ordering.management.commands.benchmark_chat_context import synthetic_catalog
+from ordering.matching import NUM_WORDS, INTENT_WORDS, ProductMatcher, product_aliases
+
+
+def legacy_parse(message, products):
+    """The per-request matcher chat_api used before ProductMatcher: rebuild the alias list, then
+    run one regex per alias plus one per number word until something matches."""
+    product_index = [(alias, pid) for pid, name in products for alias in product_aliases(name)]
+    text = (message or '').lower()
+    if not (any(w in text for w in INTENT_WORDS) or re.search(r'\b\d+\b', text)):
+        return []
+    items, used = [], set()
+    for alias, pid in product_index:
+        m = re.search(rf"(\d+)\s*(?:x\s*)?{re.escape(alias)}\b", text)
+        qty = int(m.group(1)) if m else None
+        if qty is None:
+            for w, val in NUM_WORDS.items():
+                if re.search(rf"\b{w}\s+{re.escape(alias)}\b", text):
+                    qty = val
+                    break
+        if qty is None and alias in text:
+            qty = 1
+        if qty and pid not in used:
+            items.append((pid, max(1, int(qty))))
+            used.add(pid)
+    return items
+
+
+def sample_messages(names, count, seed=11):
+    rng = random.Random(seed)
+    messages = ['what do you recommend?', 'is the chicken spicy?']
+    while len(messages) < count:
+        a, b = rng.sample(names, 2)
+        messages.append(rng.choice([
+            f'i want {rng.randint(1, 5)} {a.lower()} and {b.lower()}',
+            f'add two {a.lower()} please',
+            f'can i get {rng.randint(1, 3)} x {a.lower()}',
+        ]))
+    return messages
+
+
+class Command(BaseCommand):
+    help = 'Compare per-message chat order parsing: ProductMatcher vs the old per-product regex loop.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='100,1000,2000', help='Comma-separated synthetic catalog sizes.')
+        parser.add_argument('--messages', type=int, default=10)
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{'products':>8} {'build ms':>9} {'matcher ms/msg':>15} {'legacy ms/msg':>14} {'speedup':>8}")
+        for size in [int(s) for s in options['sizes'].split(',') if s.strip()]:
+            products = [(str(p.id), p.name) for p in synthetic_catalog(size).products]
+            messages = sample_messages([name for _, name in products], options['messages'])
+
+            started = time.perf_counter()
+            matcher = ProductMatcher(products)  # built once per catalog version in production
+            build_time = time.perf_counter() - started
+
+            started = time.perf_counter()
+            for message in messages:
+                matcher.parse(message)
+            matcher_time = (time.perf_counter() - started) / len(messages)
+
+            started = time.perf_counter()
+            for message in messages:
+                legacy_parse(message, products)
+            legacy_time = (time.perf_counter() - started) / len(messages)
+
+            self.stdout.write(f'{size:>8} {build_time * 1000:>9.1f} {matcher_time * 1000:>15.3f} '
+                              f'{legacy_time * 1000:>14.1f} {legacy_time / matcher_time:>7.0f}x')
@@ -0,0 +1,68 @@
+import time
+
+from django.core.management.base import BaseCommand
+from mongoengine.queryset.visitor import Q
+
+from ordering.management.commands.benchmark_chat_context import synthetic_catalog
+from ordering.models import Product
+
+QUERIES = ['zinger', 'zing', 'spicy wings', 'chiken', 'family bucket', 'lemonade 42', 'nothing here']
+
+
+def legacy_filter(query):
+    """The raw filter the menu view sent to Mongo before the search index."""
+    q = Q(is_available=True) & (Q(name__icontains=query) | Q(description__icontains=query))
+    return Product.objects(q)._query
+
+
+class Command(BaseCommand):
+    help = ('Compare menu search: the in-memory BM25 index vs the old icontains query, run against a '
+            'scratch copy of a synthetic catalog in the configured MongoDB.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=50000, help='Synthetic catalog size.')
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        catalog = synthetic_catalog(options['size'])
+        started = time.perf_counter()
+        catalog.search_index
+        self.stdout.write(f"{options['size']} products, index build {(time.perf_counter() - started) * 1000:.0f} ms")
+
+        bench = self._scratch_collection(catalog.products)
+        try:
+            self.stdout.write(f"{'query':>14} {'index hits':>10} {'index ms':>9} {'mongo hits':>10} {'mongo ms':>9}")
+            for query in QUERIES:
+                started = time.perf_counter()
+                for _ in range(options['repeat']):
+                    hits = catalog.search_index.search(query)
+                index_ms = (time.perf_counter() - started) / options['repeat'] * 1000
+                mongo = '-'.rjust(10) + ' ' + '-'.rjust(9)
+                if bench is not None:
+                    started = time.perf_counter()
+                    for _ in range(options['repeat']):
+                        found = list(bench.find(legacy_filter(query), {'name': 1}).sort('created_at', -1))
+                    mongo = f"{len(found):>10} {(time.perf_counter() - started) / options['repeat'] * 1000:>9.1f}"
+                self.stdout.write(f'{query:>14} {len(hits):>10} {index_ms:>9.2f} {mongo}')
+        finally:
+            if bench is not None:
+                bench.drop()
+
+    def _scratch_collection(self, products):
+        """Load the catalog into '<products collection>_bench' with the same indexes, or None if
+        MongoDB is not reachable (only the index is timed then)."""
+        try:
+            coll = Product._get_collection()
+            bench = coll.database[coll.name + '_bench']
+            bench.drop()
+            for name, spec in coll.index_information().items():
+                if name != '_id_':
+                    bench.create_index(spec['key'], name=name)
+            docs = [{'_id': p.id, 'name': p.name, 'description': p.description, 'category': p.category,
+                     'price': p.price, 'is_available': p.is_available, 'created_at': p.created_at} for p in products]
+            for i in range(0, len(docs), 5000):
+                bench.insert_many(docs[i:i + 5000], ordered=False)
+        except Exception as e:
+            self.stderr.write(f'MongoDB not available ({e.__class__.__name__}); timing the index only.')
+            return None
+        return bench
@@ -0,0 +1,80 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from pymongo import UpdateMany, UpdateOne
+
+from ordering.backfill import _PLACEHOLDER_RE
+from ordering.models import Customer, Order, Receipt
+
+
+class Command(BaseCommand):
+    help = 'Fill the indexed identity fields on existing data: Customer.name_lower, Customer.user_id and Receipt.customer.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument(
+            '--claim-by-phone-and-name', action='store_true',
+            help=('Also link unclaimed customers to a user when they share a phone with one of that user\'s '
+                  'customers or are named like the username. Order history and receipts only follow '
+                  'user_id and account email, so run this once, deliberately, after checking the data.'))
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        customers = Customer._get_collection()
+
+        result = customers.update_many(
+            {'name_lower': {'$exists': False}},
+            [{'$set': {'name_lower': {'$toLower': {'$ifNull': ['$name', '']}}}}])
+        self.stdout.write(f'Set name_lower on {result.modified_count} customers.')
+
+        linked = 0
+        ops = []
+        for user in get_user_model().objects.only('id', 'email', 'username').iterator():
+            emails = [e for e in {user.email, f'user-{user.id}@kfc.local'} if e]
+            ops.append(UpdateMany({'email': {'$in': emails}, 'user_id': None}, {'$set': {'user_id': user.id}}))
+            if len(ops) >= batch_size:
+                linked += customers.bulk_write(ops, ordered=False).modified_count
+                ops = []
+        if ops:
+            linked += customers.bulk_write(ops, ordered=False).modified_count
+        self.stdout.write(f'Linked {linked} customers to user accounts.')
+        if options['claim_by_phone_and_name']:
+            self.stdout.write(f'Claimed {self._claim_by_phone_and_name(customers, batch_size)} customers by phone or name.')
+
+        receipts = Receipt._get_collection()
+        filled = 0
+        while True:
+            batch = list(receipts.find({'customer': {'$exists': False}}, {'order': 1}).limit(batch_size))
+            if not batch:
+                break
+            owners = {o['_id']: o.get('customer') for o in Order._get_collection().find(
+                {'_id': {'$in': [r['order'] for r in batch]}}, {'customer': 1})}
+            receipts.bulk_write([UpdateOne({'_id': r['_id']}, {'$set': {'customer': owners.get(r['order'])}})
+                                 for r in batch], ordered=False)
+            filled += len(batch)
+        self.stdout.write(self.style.SUCCESS(f'Set customer on {filled} receipts.'))
+
+    def _claim_by_phone_and_name(self, customers, batch_size):
+        phones = {}
+        for row in customers.aggregate([
+            {'$match': {'user_id': {'$ne': None}, 'phone': {'$nin': [None, '']}}},
+            {'$group': {'_id': '$user_id', 'phones': {'$addToSet': '$phone'}}},
+        ]):
+            phones[row['_id']] = row['phones']
+        claimed = 0
+        ops = []
+        for user in get_user_model().objects.only('id', 'username').iterator():
+            match = []
+            if phones.get(user.id):
+                match.append({'phone': {'$in': phones[user.id]}})
+            uname = (user.username or '').lower()
+            # Placeholder names ("guest", "customer") belong to nobody in particular
+            if uname and not _PLACEHOLDER_RE.match(uname):
+                match.append({'name_lower': uname})
+            if match:
+                ops.append(UpdateMany({'user_id': None, '$or': match}, {'$set': {'user_id': user.id}}))
+            if len(ops) >= batch_size:
+                claimed += customers.bulk_write(ops).modified_count
+                ops = []
+        if ops:
+            claimed += customers.bulk_write(ops).modified_count
+        return claimed
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from ordering.images import AVATAR_SIZES, VARIANT_SIZES, Image, generate_variants
+from ordering.models import Customer, Product
+
+
+class Command(BaseCommand):
+    help = 'Generate resized WebP derivatives for product images and customer avatars.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--missing-only', action='store_true', help='Skip documents that already have derivatives.')
+        parser.add_argument('--skip-avatars', action='store_true')
+
+    def handle(self, *args, **options):
+        if Image is None:
+            raise CommandError('Pillow is not installed; run `pip install Pillow` first.')
+        targets = [(Product, 'image', 'image_variants', VARIANT_SIZES)]
+        if not options['skip_avatars']:
+            targets.append((Customer, 'avatar', 'avatar_variants', AVATAR_SIZES))
+        for document_cls, field, variants_field, sizes in targets:
+            query = {f'{field}__ne': None}
+            if options['missing_only']:
+                query[f'{variants_field}__in'] = [None, {}]
+            done = 0
+            for doc in document_cls.objects(**query).only('id'):
+                if generate_variants(document_cls, doc.id, field, variants_field, sizes):
+                    done += 1
+            self.stdout.write(self.style.SUCCESS(f'{document_cls.__name__}: regenerated {done} image(s).'))
@@ -0,0 +1,63 @@
+import re
+
+NUM_WORDS = {
+    'a': 1, 'an': 1, 'one': 1, 'two': 2, 'three': 3, 'four': 4,
+    'five': 5, 'six': 6, 'seven': 7, 'eight': 8, 'nine': 9, 'ten': 10
+}
+INTENT_WORDS = ['order', 'buy', 'add', 'want', 'get', 'take']
+_NUMBER_RE = re.compile(r'\b\d+\b')
+
+
+def product_aliases(name):
+    """Lowercase name plus a naive plural of the last word."""
+    base = (name or '').strip().lower()
+    if not base:
+        return set()
+    aliases = {base}
+    if not base.split()[-1].endswith('s'):
+        aliases.add(base + 's')
+    return aliases
+
+
+class ProductMatcher:
+    """All product aliases compiled into one regex, so a message is scanned once
+    for "<qty> [x] <alias>", "<number word> <alias>" or a bare alias."""
+
+    def __init__(self, products):
+        self.alias_ids = {}
+        for pid, name in products:
+            for alias in product_aliases(name):
+                self.alias_ids.setdefault(alias, pid)
+        self.pattern = None
+        if self.alias_ids:
+            # Longest alias first so "chicken wings" wins over "chicken"
+            alternation = '|'.join(re.escape(a) for a in sorted(self.alias_ids, key=len, reverse=True))
+            words = '|'.join(NUM_WORDS)
+            self.pattern = re.compile(rf"(?:(\d+)\s*(?:x\s*)?|\b({words})\s+)?\b({alternation})\b")
+
+    def parse(self, message):
+        """Return [(product_id, qty)] in order of first mention, or [] when the
+        message does not look like an order."""
+        text = (message or '').lower()
+        if not self.pattern:
+            return []
+        if not (any(w in text for w in INTENT_WORDS) or _NUMBER_RE.search(text)):
+            return []
+        items = []
+        seen = set()
+        for m in self.pattern.finditer(text):
+            pid = self.alias_ids[m.group(3)]
+            if pid in seen:
+                continue
+            if m.group(1):
+                qty = int(m.group(1))
+            elif m.group(2):
+                qty = NUM_WORDS[m.group(2)]
+            else:
+                qty = 1
+            if qty <= 0:
+                continue
+            seen.add(pid)
+            items.append((pid, qty))
+        return items
+
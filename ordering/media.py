@@ -0,0 +1,90 @@
+import calendar
+import re
+
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+IMMUTABLE_CACHE = 'public, max-age=31536000, immutable'
+SHORT_CACHE = 'public, max-age=300'
+
+_RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def _parse_range(header, length):
+    """Return (start, end) for a single satisfiable byte range, None to send the whole
+    file, or False when the range cannot be satisfied."""
+    m = _RANGE_RE.match((header or '').strip())
+    if not m or (not m.group(1) and not m.group(2)):
+        return None
+    if m.group(1):
+        start = int(m.group(1))
+        end = int(m.group(2)) if m.group(2) else length - 1
+    else:
+        # Suffix range: the last N bytes
+        start = max(0, length - int(m.group(2)))
+        end = length - 1
+    if start >= length or end < start:
+        return False
+    return start, min(end, length - 1)
+
+
+def _iter_chunks(gridout, start, length):
+    gridout.seek(start)
+    remaining = length
+    block = gridout.chunk_size or 255 * 1024
+    while remaining > 0:
+        data = gridout.read(min(block, remaining))
+        if not data:
+            break
+        remaining -= len(data)
+        yield data
+
+
+def gridfs_response(request, proxy, default_content_type='application/octet-stream'):
+    """Stream a GridFS file with ETag/Last-Modified validators, 304s and single Range support.
+    URLs carrying ?v=<grid id> are treated as immutable and cached for a year."""
+    grid_id = getattr(proxy, 'grid_id', None)
+    if not grid_id:
+        raise Http404()
+    etag = f'"{grid_id}"'
+    versioned = request.GET.get('v') == str(grid_id)
+
+    def _finish(response):
+        response['ETag'] = etag
+        response['Cache-Control'] = IMMUTABLE_CACHE if versioned else SHORT_CACHE
+        return response
+
+    # The ETag is the GridFS id, so a revalidation never has to touch GridFS
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        return _finish(not_modified)
+
+    gridout = proxy.get()
+    if gridout is None:
+        raise Http404()
+    upload_date = getattr(gridout, 'upload_date', None)
+    last_modified = calendar.timegm(upload_date.utctimetuple()) if upload_date else None
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if not_modified is not None:
+        return _finish(not_modified)
+
+    length = gridout.length
+    content_type = getattr(gridout, 'content_type', None) or default_content_type
+    byte_range = _parse_range(request.META.get('HTTP_RANGE'), length) if length else None
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{length}'
+        return _finish(response)
+    if byte_range:
+        start, end = byte_range
+        response = StreamingHttpResponse(_iter_chunks(gridout, start, end - start + 1), status=206, content_type=content_type)
+        response['Content-Range'] = f'bytes {start}-{end}/{length}'
+        response['Content-Length'] = str(end - start + 1)
+    else:
+        response = StreamingHttpResponse(_iter_chunks(gridout, 0, length), content_type=content_type)
+        response['Content-Length'] = str(length)
+    response['Accept-Ranges'] = 'bytes'
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified)
+    return _finish(response)
@@ -0,0 +1,71 @@
+from django.conf import settings
+
+
+def estimate_tokens(text):
+    """Rough prompt-token count (about four characters per token for English text)."""
+    return (len(text or '') + 3) // 4
+
+
+def _in_stock(product):
+    try:
+        return product.stock_quantity is None or int(product.stock_quantity) > 0
+    except Exception:
+        return True
+
+
+def menu_item(product):
+    return {
+        'name': product.name,
+        'category': product.category or '',
+        'price': float(product.price),
+        'in_stock': _in_stock(product),
+    }
+
+
+def category_summary(catalog):
+    """One line per category: item count and price range of available products."""
+    lines = []
+    for name, products in sorted(catalog.by_category.items()):
+        prices = [float(p.price) for p in products]
+        lines.append(f"- {name}: {len(products)} items, ${min(prices):.2f}-${max(prices):.2f}")
+    return "\n".join(lines)
+
+
+def _representatives(catalog):
+    """Available products taken round-robin across categories, newest first within each."""
+    queues = [list(products) for _, products in sorted(catalog.by_category.items())]
+    while any(queues):
+        for q in queues:
+            if q:
+                yield q.pop(0)
+
+
+def menu_context(catalog, question, history=None, top_k=None, token_budget=None):
+    """Pick the products worth showing the model for this question.
+    Returns (items, summary): the most relevant available products by BM25 over the question
+    and recent user turns, topped up with one-per-category picks for vague questions, cut to
+    top_k items and to token_budget estimated tokens of catalog lines."""
+    top_k = top_k or int(getattr(settings, 'CHAT_CONTEXT_TOP_K', 12))
+    token_budget = token_budget or int(getattr(settings, 'CHAT_CONTEXT_TOKEN_BUDGET', 600))
+    recent = [t.get('content') or '' for t in (history or [])[-4:]
+              if isinstance(t, dict) and t.get('role', 'user') == 'user']
+    query = ' '.join(recent + [question or ''])
+    chosen = [catalog.get(pid) for pid in catalog.search_index.search(query, require_all=False)[:top_k]]
+    if len(chosen) < top_k:
+        seen = {p.id for p in chosen}
+        for p in _representatives(catalog):
+            if len(chosen) >= top_k:
+                break
+            if p.id not in seen:
+                chosen.append(p)
+    summary = category_summary(catalog)
+    used = estimate_tokens(summary)
+    items = []
+    for p in chosen:
+        item = menu_item(p)
+        cost = estimate_tokens(f"- {item['name']} [{item['category']}] - ${item['price']:.2f}")
+        if items and used + cost > token_budget:
+            break
+        items.append(item)
+        used += cost
+    return items, summary
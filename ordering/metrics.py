@@ -0,0 +1,26 @@
+from .models import Order
+from .routing import reads
+
+
+def dashboard_metrics():
+    """Order counts per status plus total revenue, computed server-side in one aggregation."""
+    pipeline = [
+        {'$project': {'_id': 0, 'status': 1, 'total_amount': 1}},
+        {'$group': {
+            '_id': '$status',
+            'count': {'$sum': 1},
+            'revenue': {'$sum': {'$ifNull': ['$total_amount', 0]}},
+        }},
+    ]
+    by_status = {}
+    revenue = 0.0
+    for row in reads(Order).aggregate(pipeline):
+        by_status[row['_id']] = row['count']
+        revenue += row['revenue'] or 0
+    return {
+        'total_orders': sum(by_status.values()),
+        'completed': by_status.get('completed', 0),
+        'pending': by_status.get('pending', 0),
+        'revenue': revenue,
+        'by_status': by_status,
+    }
@@ -0,0 +1,93 @@
+import logging
+import threading
+
+from django.conf import settings
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+_totals_lock = threading.Lock()
+_totals = {}
+
+
+class RequestQueryStats:
+    def __init__(self):
+        self.count = 0
+        self.micros = 0
+        self.slowest = None  # (micros, 'command collection')
+        self._pending = {}
+
+
+class QueryStatsListener(monitoring.CommandListener):
+    """Counts Mongo commands issued by the thread that is serving a request."""
+
+    def started(self, event):
+        stats = getattr(_local, 'stats', None)
+        if stats is not None:
+            target = event.command.get(event.command_name)
+            label = f'{event.command_name} {target}' if isinstance(target, str) else event.command_name
+            stats._pending[event.request_id] = label
+
+    def _finished(self, event):
+        stats = getattr(_local, 'stats', None)
+        if stats is None:
+            return
+        label = stats._pending.pop(event.request_id, event.command_name)
+        stats.count += 1
+        stats.micros += event.duration_micros
+        if stats.slowest is None or event.duration_micros > stats.slowest[0]:
+            stats.slowest = (event.duration_micros, label)
+        if event.duration_micros / 1000 >= float(getattr(settings, 'MONGO_SLOW_COMMAND_MS', 100)):
+            logger.warning('Slow Mongo command %s took %.1f ms', label, event.duration_micros / 1000)
+
+    def succeeded(self, event):
+        self._finished(event)
+
+    def failed(self, event):
+        self._finished(event)
+
+
+query_listener = QueryStatsListener()
+
+
+def _record(view, stats):
+    with _totals_lock:
+        row = _totals.setdefault(view, {'requests': 0, 'queries': 0, 'mongo_ms': 0.0, 'max_queries': 0})
+        row['requests'] += 1
+        row['queries'] += stats.count
+        row['mongo_ms'] += stats.micros / 1000
+        row['max_queries'] = max(row['max_queries'], stats.count)
+
+
+def query_metrics():
+    """Per-view Mongo usage since the process started, heaviest views first."""
+    with _totals_lock:
+        rows = [dict(row, view=view) for view, row in _totals.items()]
+    for row in rows:
+        row['avg_queries'] = round(row['queries'] / row['requests'], 1)
+        row['avg_mongo_ms'] = round(row.pop('mongo_ms') / row['requests'], 2)
+    return sorted(rows, key=lambda r: -r['avg_mongo_ms'])
+
+
+class MongoQueryStatsMiddleware:
+    """Records query count, total Mongo time and the slowest command for every request.
+    Adds X-Mongo-* response headers when DEBUG is on; always feeds query_metrics()."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats = _local.stats = RequestQueryStats()
+        try:
+            response = self.get_response(request)
+        finally:
+            _local.stats = None
+        match = getattr(request, 'resolver_match', None)
+        _record(getattr(match, 'view_name', None) or 'unresolved', stats)
+        if settings.DEBUG:
+            response['X-Mongo-Queries'] = str(stats.count)
+            response['X-Mongo-Time-Ms'] = f'{stats.micros / 1000:.1f}'
+            if stats.slowest:
+                response['X-Mongo-Slowest'] = f'{stats.slowest[1]} {stats.slowest[0] / 1000:.1f}ms'
+        return response
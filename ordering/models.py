@@ -1,5 +1,14 @@
 import datetime
-from mongoengine import Document, StringField, IntField, FloatField, DateTimeField, ListField, DictField, FileField, BooleanField, ReferenceField
+from mongoengine import Document, StringField, IntField, FloatField, DateTimeField, ListField, DictField, FileField, BooleanField, ReferenceField, ObjectIdField
+
+def _versioned_url(base, original, variants=None, size=None):
+    # Versioned by GridFS id so the file can be cached as immutable
+    grid_id = (variants or {}).get(size) if size else None
+    if grid_id:
+        return f"{base}?size={size}&v={grid_id}"
+    grid_id = getattr(original, 'grid_id', None)
+    return f"{base}?v={grid_id}" if grid_id else base
+
 
 class Product(Document):
     name = StringField(max_length=200, required=True)
@@ -8,20 +17,97 @@ class Product(Document):
     category = StringField(max_length=100, choices=['chicken', 'burgers', 'sides', 'drinks', 'desserts'])
     stock_quantity = IntField(default=0)
     image = FileField()  # GridFS storage
+    image_variants = DictField()  # {'thumb'|'card'|'full': GridFS id of the WebP derivative}
     is_available = BooleanField(default=True)
     created_at = DateTimeField(default=datetime.datetime.now)
 
     meta = {'collection': 'kfc_products', 'indexes': ['category', 'name']}
 
+    @property
+    def image_url(self):
+        return _versioned_url(f"/image/{self.id}/", self.image)
+
+    @property
+    def thumb_url(self):
+        return _versioned_url(f"/image/{self.id}/", self.image, self.image_variants, 'thumb')
+
+    @property
+    def card_url(self):
+        return _versioned_url(f"/image/{self.id}/", self.image, self.image_variants, 'card')
+
+    @property
+    def full_url(self):
+        return _versioned_url(f"/image/{self.id}/", self.image, self.image_variants, 'full')
+
+class CatalogVersion(Document):
+    """Monotonic counter bumped on product edits and availability changes; process-local catalog caches key on it."""
+    name = StringField(primary_key=True, default='catalog')
+    version = IntField(default=0)
+
+    meta = {'collection': 'kfc_catalog_version'}
+
+
+class Cart(Document):
+    """Shopping cart: product ids and quantities only; names and prices come from the catalog."""
+    cart_id = StringField(primary_key=True)
+    lines = DictField()  # {product_id: quantity}
+    updated_at = DateTimeField()
+
+    # Abandoned carts expire with Django's default two-week session age
+    meta = {'collection': 'kfc_carts', 'indexes': [
+        {'fields': ['updated_at'], 'expireAfterSeconds': 1209600},
+    ]}
+
+
+class JobRun(Document):
+    """Progress of a resumable maintenance job; one document per job name."""
+    name = StringField(primary_key=True)
+    status = StringField(choices=['running', 'done', 'failed'])
+    last_id = ObjectIdField()  # resume point: last document handled
+    processed = IntField(default=0)
+    updated = IntField(default=0)
+    started_at = DateTimeField()
+    heartbeat_at = DateTimeField()
+    finished_at = DateTimeField()
+    error = StringField()
+
+    meta = {'collection': 'kfc_job_runs'}
+
+
+class AIResponse(Document):
+    """Shared cache of generated Gemini text; Mongo drops entries once expires_at passes."""
+    key = StringField(primary_key=True)
+    method = StringField()
+    text = StringField()
+    expires_at = DateTimeField()
+
+    meta = {'collection': 'kfc_ai_responses', 'indexes': [
+        {'fields': ['expires_at'], 'expireAfterSeconds': 0},
+    ]}
+
 class Customer(Document):
     name = StringField(max_length=100, required=True)
     email = StringField(max_length=150, required=True, unique=True)
     phone = StringField(max_length=20)
     address = StringField()
     avatar = FileField()  # GridFS avatar
+    avatar_variants = DictField()  # {'thumb'|'card': GridFS id of the WebP derivative}
+    user_id = IntField()  # Django auth user this customer belongs to, once known
+    name_lower = StringField(max_length=100)  # kept in sync by clean() for indexed case-insensitive lookups
     created_at = DateTimeField(default=datetime.datetime.now)
 
-    meta = {'collection': 'kfc_customers'}
+    meta = {'collection': 'kfc_customers', 'indexes': ['user_id', 'phone', 'name_lower']}
+
+    def clean(self):
+        self.name_lower = (self.name or '').lower()
+
+    @property
+    def avatar_url(self):
+        return _versioned_url(f"/avatar/{self.id}/", self.avatar, self.avatar_variants, 'card')
+
+    @property
+    def avatar_thumb_url(self):
+        return _versioned_url(f"/avatar/{self.id}/", self.avatar, self.avatar_variants, 'thumb')
 
 class Order(Document):
     ORDER_STATUS = (
@@ -45,17 +131,57 @@ class Order(Document):
     gemini_analysis = StringField()
     business_insights = StringField()
     automation_started = BooleanField(default=False)
+    next_transition_at = DateTimeField()  # when the status scheduler should advance this order
+    rollup_batch = StringField(max_length=32)  # RollupBatch token; counted in SalesRollup once that batch is closed
+
+    meta = {'collection': 'kfc_orders', 'indexes': [
+        'order_number', 'customer', 'status', 'created_at',
+        ('status', 'next_transition_at'),
+        ('status', 'rollup_batch'),
+        ('-created_at', '-id'),
+        ('status', '-created_at', '-id'),
+        ('status', 'updated_at'),
+        ('customer', '-created_at', '-id'),
+    ]}
+
+class SalesRollup(Document):
+    """Per-day sales counters for completed orders, by total / category / product."""
+    DIMENSIONS = ('total', 'category', 'product')
+
+    day = DateTimeField(required=True)  # midnight of the order's created_at
+    dimension = StringField(max_length=20, choices=DIMENSIONS, required=True)
+    key = StringField(max_length=200, default='')  # '' for total, category name, or product id
+    label = StringField(max_length=200)
+    orders = IntField(default=0)
+    quantity = IntField(default=0)
+    revenue = FloatField(default=0.0)
+    batches = ListField(StringField())  # RollupBatch tokens already counted here, cleared once the batch closes
+
+    meta = {'collection': 'kfc_sales_rollups', 'indexes': [
+        {'fields': ['day', 'dimension', 'key'], 'unique': True},
+    ]}
+
+class RollupBatch(Document):
+    """An open claim on orders being folded into SalesRollup. Deleted once the batch is counted;
+    a claim left behind by a crashed worker is picked up again after it goes stale."""
+    token = StringField(primary_key=True)
+    claimed_at = DateTimeField(required=True)
 
-    meta = {'collection': 'kfc_orders', 'indexes': ['order_number', 'customer', 'status', 'created_at']}
+    meta = {'collection': 'kfc_rollup_batches', 'indexes': ['claimed_at']}
 
 class Receipt(Document):
     order = ReferenceField(Order, required=True)
+    customer = ReferenceField(Customer)  # copied from the order so a customer's receipts are one indexed query
     receipt_number = StringField(max_length=20, unique=True, required=True)
     receipt_data = DictField(required=True)
     generated_at = DateTimeField(default=datetime.datetime.now)
     is_printed = BooleanField(default=False)
 
-    meta = {'collection': 'kfc_receipts'}
+    # One receipt per order; concurrent creators race on this index instead of inserting twice
+    meta = {'collection': 'kfc_receipts', 'indexes': [
+        {'fields': ['order'], 'unique': True},
+        ('customer', '-generated_at', '-id'),
+    ]}
 
 
 class Suggestion(Document):
@@ -0,0 +1,34 @@
+from datetime import datetime
+
+from bson import ObjectId
+from mongoengine.queryset.visitor import Q
+
+
+def encode_cursor(dt, oid):
+    return f"{dt.isoformat()}_{oid}"
+
+
+def decode_cursor(value):
+    """Parse a cursor from encode_cursor; returns (datetime, ObjectId) or None."""
+    try:
+        stamp, oid = (value or '').rsplit('_', 1)
+        return datetime.fromisoformat(stamp), ObjectId(oid)
+    except Exception:
+        return None
+
+
+def keyset_page(queryset, cursor=None, per_page=25, field='created_at'):
+    """Newest-first page of `queryset` strictly after `cursor`, ordered by (field, _id).
+    Returns (rows, next_cursor); next_cursor is None on the last page.
+    If the queryset uses only(), it must include `field`."""
+    after = decode_cursor(cursor) if cursor else None
+    if after:
+        dt, oid = after
+        queryset = queryset.filter(Q(**{f'{field}__lt': dt}) | Q(**{field: dt, 'id__lt': oid}))
+    rows = list(queryset.order_by(f'-{field}', '-id').limit(per_page + 1))
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        last = rows[-1]
+        next_cursor = encode_cursor(getattr(last, field), last.id)
+    return rows, next_cursor
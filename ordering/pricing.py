@@ -0,0 +1,68 @@
+import hashlib
+import json
+
+from bson import ObjectId
+
+from .models import Product
+
+
+class PricedCart:
+    """Cart lines checked against current product data.
+    items: [{'product_id', 'name', 'price', 'quantity', 'subtotal'}] for lines that can be bought.
+    changes: {product_id: quantity} corrections to write back to the cart (0 removes the line).
+    issues: human-readable notes about lines that were capped or dropped."""
+
+    def __init__(self, items, changes, issues):
+        self.items = items
+        self.changes = changes
+        self.issues = issues
+        self.total = sum(i['subtotal'] for i in items)
+
+    def __bool__(self):
+        return bool(self.items)
+
+    def quote(self):
+        """Fingerprint of the lines, quantities and prices shown to the customer. Checkout posts it
+        back so a cart that changed in between is never charged silently."""
+        lines = sorted([i['product_id'], i['quantity'], round(i['price'], 2)] for i in self.items)
+        return hashlib.sha256(json.dumps(lines).encode('utf-8')).hexdigest()[:16]
+
+    def order_items(self):
+        return [{k: i[k] for k in ('product_id', 'name', 'quantity', 'price')} for i in self.items]
+
+
+def price_cart(lines):
+    """Price {product_id: quantity} with one id__in query, capping quantities by stock and
+    dropping products that were deleted or made unavailable."""
+    ids = [ObjectId(pid) for pid in lines if ObjectId.is_valid(str(pid))]
+    products = {}
+    if ids:
+        products = {str(p.id): p for p in Product.objects(id__in=ids).only(
+            'name', 'price', 'stock_quantity', 'is_available')}
+    items, changes, issues = [], {}, []
+    for pid, qty in lines.items():
+        qty = int(qty)
+        prod = products.get(str(pid))
+        if not prod or not prod.is_available:
+            changes[pid] = 0
+            if prod:
+                issues.append(f'{prod.name} is no longer available and was removed from your cart.')
+            continue
+        if prod.stock_quantity is not None and qty > int(prod.stock_quantity):
+            qty = max(0, int(prod.stock_quantity))
+            changes[pid] = qty
+            if qty:
+                issues.append(f'Only {qty} x {prod.name} left; your cart was updated.')
+            else:
+                issues.append(f'{prod.name} is sold out and was removed from your cart.')
+        if qty <= 0:
+            continue
+        price = float(prod.price)
+        items.append({
+            'product_id': str(pid),
+            'name': prod.name,
+            'price': price,
+            'quantity': qty,
+            'subtotal': price * qty,
+        })
+    return PricedCart(items, changes, issues)
@@ -0,0 +1,87 @@
+import datetime
+import threading
+
+from mongoengine.errors import NotUniqueError
+from pymongo.errors import DuplicateKeyError
+
+from .gemini_ai import get_gemini
+from .models import Order, Receipt
+from .tasks import enqueue
+from .utils import generate_receipt_number
+
+# Seconds before each retry when Gemini gives no receipt text (fallback or open breaker); after the
+# last one the template becomes the final text
+RETRY_DELAYS = (10, 40)
+# Pages stop waiting for the AI text after this long, even if a retry was lost with its process
+PENDING_FOR = datetime.timedelta(minutes=2)
+
+
+def template_text(order):
+    """Deterministic receipt text shown until the AI version is ready."""
+    items = ', '.join(
+        f"{i.get('name')} x {i.get('quantity')} - ${float(i.get('price', 0)) * int(i.get('quantity', 0)):.2f}"
+        for i in order.items or [])
+    return (
+        "KFC Receipt\n"
+        f"Items: {items}\n"
+        f"Total: ${float(order.total_amount or 0):.2f}\n"
+        "Note: Thank you for choosing KFC! Your order is being prepared with care."
+    )
+
+
+def ensure_receipt(order):
+    """Return the order's receipt, creating the template version (and queueing the AI text) if
+    it does not exist yet. Safe to call concurrently: the unique index on order picks one winner."""
+    receipt = Receipt.objects(order=order.id).first()
+    if receipt:
+        return receipt
+    try:
+        Receipt.objects(order=order.id).update_one(
+            upsert=True,
+            set_on_insert__receipt_number=generate_receipt_number(),
+            set_on_insert__customer=order.customer.pk if order.customer else None,
+            set_on_insert__receipt_data={'text': template_text(order), 'source': 'template'},
+            set_on_insert__generated_at=datetime.datetime.now(),
+            set_on_insert__is_printed=False,
+        )
+    except (NotUniqueError, DuplicateKeyError):
+        pass
+    else:
+        enqueue(generate_receipt_text, order.id)
+    return Receipt.objects(order=order.id).first()
+
+
+def _retry_later(order_id, attempt):
+    timer = threading.Timer(RETRY_DELAYS[attempt], enqueue, args=(generate_receipt_text, order_id, attempt + 1))
+    timer.daemon = True
+    timer.start()
+
+
+def generate_receipt_text(order_id, attempt=0):
+    """Replace a template receipt's text with the AI-written version, retrying a few times
+    when Gemini is unavailable before settling on the template."""
+    order = Order.objects(id=order_id).only('order_number', 'total_amount', 'items').first()
+    if not order:
+        return
+    if not Receipt.objects(order=order_id, receipt_data__source='template').count():
+        return
+    ai = get_gemini()
+    text = ai.generate_kfc_receipt({'order_number': order.order_number, 'total': order.total_amount, 'items': order.items})
+    if not text or text == ai.RECEIPT_FALLBACK:
+        if attempt < len(RETRY_DELAYS):
+            _retry_later(order_id, attempt)
+        else:
+            # Keep the template; it already carries the same thank-you note
+            Receipt.objects(order=order_id, receipt_data__source='template').update_one(
+                set__receipt_data__pending=False)
+        return
+    Receipt.objects(order=order_id, receipt_data__source='template').update_one(
+        set__receipt_data={'text': text, 'source': 'ai'})
+
+
+def receipt_pending(receipt):
+    """True while the AI text for a receipt is still being generated."""
+    data = (receipt.receipt_data or {}) if receipt else {}
+    if data.get('source') != 'template' or data.get('pending') is False:
+        return False
+    return not receipt.generated_at or datetime.datetime.now() - receipt.generated_at < PENDING_FOR
@@ -0,0 +1,184 @@
+import uuid
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from .models import Order, Product, RollupBatch, SalesRollup
+from .routing import reads
+
+PERIOD_DAYS = {'daily': 1, 'weekly': 7, 'monthly': 30, 'quarterly': 90}
+# A batch claim older than this belongs to a worker that died before closing it
+STALE_CLAIM = timedelta(minutes=10)
+
+
+def _day(dt):
+    return datetime(dt.year, dt.month, dt.day)
+
+
+def _product_categories(orders):
+    ids = set()
+    for o in orders:
+        for it in o.get('items') or []:
+            try:
+                ids.add(ObjectId(it.get('product_id')))
+            except Exception:
+                pass
+    if not ids:
+        return {}
+    return {str(p['_id']): p.get('category') or 'other'
+            for p in Product.objects(id__in=list(ids)).only('category').as_pymongo()}
+
+
+def _fold(orders):
+    """Sum a batch of orders into {(day, dimension, key): counters}."""
+    categories = _product_categories(orders)
+    buckets = {}
+
+    def bump(day, dimension, key, label, quantity, revenue, counted):
+        b = buckets.setdefault((day, dimension, key), {'label': label, 'orders': 0, 'quantity': 0, 'revenue': 0.0})
+        if (day, dimension, key) not in counted:
+            b['orders'] += 1
+            counted.add((day, dimension, key))
+        b['quantity'] += quantity
+        b['revenue'] += revenue
+
+    for o in orders:
+        day = _day(o.get('created_at') or datetime.utcnow())
+        counted = set()
+        bump(day, 'total', '', 'All', 0, float(o.get('total_amount') or 0), counted)
+        for it in o.get('items') or []:
+            try:
+                qty = int(it.get('quantity') or 0)
+                line = float(it.get('price') or 0) * qty
+            except Exception:
+                continue
+            pid = str(it.get('product_id') or '')
+            bump(day, 'total', '', 'All', qty, 0.0, counted)
+            bump(day, 'product', pid, it.get('name') or pid, qty, line, counted)
+            cat = categories.get(pid, 'other')
+            bump(day, 'category', cat, cat, qty, line, counted)
+    return buckets
+
+
+def _apply(buckets, token):
+    """Add a batch to its buckets at most once: each bucket remembers the batch tokens it has
+    counted, so a batch replayed after a crash only fills in the buckets it missed."""
+    if not buckets:
+        return
+    coll = SalesRollup._get_collection()
+    keys = [{'day': day, 'dimension': dimension, 'key': key} for day, dimension, key in buckets]
+    try:
+        coll.bulk_write([UpdateOne(k, {'$setOnInsert': {'orders': 0, 'quantity': 0, 'revenue': 0.0}}, upsert=True)
+                         for k in keys], ordered=False)
+    except BulkWriteError as e:
+        # Another worker created the same bucket first; anything else is a real failure
+        if any(err.get('code') != 11000 for err in e.details.get('writeErrors', [])):
+            raise
+    coll.bulk_write([UpdateOne(
+        dict(k, batches={'$ne': token}),
+        {'$inc': {'orders': c['orders'], 'quantity': c['quantity'], 'revenue': c['revenue']},
+         '$set': {'label': c['label']},
+         '$push': {'batches': token}},
+    ) for k, c in zip(keys, buckets.values())], ordered=False)
+
+
+def _close(token, claimed_at):
+    """Count the orders claimed by a batch and delete the claim. Only the worker still holding the
+    claim clears the token from the buckets, so a replay can never count the batch twice."""
+    orders = list(Order.objects(rollup_batch=token).only('created_at', 'items', 'total_amount').as_pymongo())
+    buckets = _fold(orders)
+    _apply(buckets, token)
+    owned = RollupBatch._get_collection().delete_one({'_id': token, 'claimed_at': claimed_at}).deleted_count
+    if owned and buckets:
+        SalesRollup._get_collection().bulk_write([
+            UpdateOne({'day': day, 'dimension': dimension, 'key': key}, {'$pull': {'batches': token}})
+            for day, dimension, key in buckets], ordered=False)
+    return len(orders)
+
+
+def _reclaim_stale():
+    """Finish batches whose worker died between claiming orders and closing the batch."""
+    coll = RollupBatch._get_collection()
+    done = 0
+    for batch in list(coll.find({'claimed_at': {'$lt': datetime.utcnow() - STALE_CLAIM}})):
+        now = datetime.utcnow()
+        if coll.update_one({'_id': batch['_id'], 'claimed_at': batch['claimed_at']},
+                           {'$set': {'claimed_at': now}}).modified_count:
+            done += _close(batch['_id'], now)
+    return done
+
+
+def rollup_completed_orders(batch_size=500):
+    """Fold completed orders that are not yet counted into SalesRollup.
+    Orders are claimed with a batch token first, so concurrent runs never count one twice,
+    and claims abandoned by a crashed run are finished here. Returns the number of orders rolled up."""
+    done = _reclaim_stale()
+    while True:
+        ids = [o['_id'] for o in Order.objects(status='completed', rollup_batch=None)
+               .only('id').limit(batch_size).as_pymongo()]
+        if not ids:
+            return done
+        token = uuid.uuid4().hex
+        claimed_at = datetime.utcnow()
+        RollupBatch._get_collection().insert_one({'_id': token, 'claimed_at': claimed_at})
+        Order.objects(id__in=ids, rollup_batch=None).update(set__rollup_batch=token)
+        done += _close(token, claimed_at)
+
+
+def reset_rollups():
+    """Drop all rollups and mark every order as not yet counted (used by the backfill command)."""
+    SalesRollup.objects.delete()
+    RollupBatch.objects.delete()
+    Order.objects(rollup_batch__ne=None).update(unset__rollup_batch=True)
+
+
+def sales_summary(period='weekly', top=8, now=None):
+    """Compact sales snapshot for a report period, read only from the rollup buckets."""
+    days = PERIOD_DAYS.get(period, 7)
+    end = _day(now or datetime.utcnow()) + timedelta(days=1)
+    start = end - timedelta(days=days)
+    weekly_buckets = days > 7
+
+    series = {}
+    for r in reads(SalesRollup)(dimension='total', day__gte=start, day__lt=end).order_by('day').as_pymongo():
+        day = r['day']
+        if weekly_buckets:
+            day = day - timedelta(days=day.weekday())
+        b = series.setdefault(day.date().isoformat(), {'orders': 0, 'items': 0, 'revenue': 0.0})
+        b['orders'] += r.get('orders', 0)
+        b['items'] += r.get('quantity', 0)
+        b['revenue'] += r.get('revenue', 0.0)
+
+    pipeline = [
+        {'$match': {'dimension': {'$in': ['category', 'product']}, 'day': {'$gte': start, '$lt': end}}},
+        # So $last picks the label from the most recent day
+        {'$sort': {'day': 1}},
+        {'$group': {
+            '_id': {'dimension': '$dimension', 'key': '$key'},
+            'label': {'$last': '$label'},
+            'quantity': {'$sum': '$quantity'},
+            'revenue': {'$sum': '$revenue'},
+        }},
+        {'$sort': {'revenue': -1}},
+    ]
+    ranked = {'category': [], 'product': []}
+    for row in reads(SalesRollup).aggregate(pipeline):
+        group = ranked[row['_id']['dimension']]
+        if len(group) < top:
+            group.append({'name': row['label'], 'quantity': row['quantity'], 'revenue': round(row['revenue'], 2)})
+
+    for b in series.values():
+        b['revenue'] = round(b['revenue'], 2)
+    return {
+        'period': period,
+        'from': start.date().isoformat(),
+        'to': (end - timedelta(days=1)).date().isoformat(),
+        'orders': sum(b['orders'] for b in series.values()),
+        'revenue': round(sum(b['revenue'] for b in series.values()), 2),
+        'bucket': 'week' if weekly_buckets else 'day',
+        'series': series,
+        'top_categories': ranked['category'],
+        'top_products': ranked['product'],
+    }
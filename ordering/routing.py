@@ -0,0 +1,50 @@
+import time
+
+from django.conf import settings
+from mongoengine.connection import get_db
+from mongoengine.queryset import QuerySet
+
+READ_ALIAS = 'secondary'
+SESSION_KEY = 'kfc_read_primary_until'
+# {document class: collection on the secondary alias}; pymongo collections are thread-safe
+_collections = {}
+
+
+def replica_reads_enabled():
+    return bool(getattr(settings, 'MONGODB_SECONDARY_READS', False))
+
+
+def _staleness():
+    return max(90, int(getattr(settings, 'MONGODB_MAX_STALENESS_SECONDS', 90)))
+
+
+def mark_write(request):
+    """Keep this visitor's history reads on the primary until secondaries have surely caught up."""
+    if replica_reads_enabled():
+        request.session[SESSION_KEY] = time.time() + _staleness()
+
+
+def wrote_recently(request):
+    try:
+        return float(request.session.get(SESSION_KEY, 0)) > time.time()
+    except Exception:
+        return False
+
+
+def _secondary_collection(document_cls):
+    coll = _collections.get(document_cls)
+    if coll is None:
+        coll = get_db(READ_ALIAS)[document_cls._get_collection_name()]
+        _collections[document_cls] = coll
+    return coll
+
+
+def reads(document_cls, request=None):
+    """QuerySet for read-only pages and reports. Goes to the secondary alias when replica reads
+    are enabled, unless `request` belongs to someone who wrote within the staleness bound.
+    The queryset is built straight on the secondary collection: QuerySet.using and switch_db
+    rebind the document class itself, which would redirect other threads' queries too."""
+    if not replica_reads_enabled() or (request is not None and wrote_recently(request)):
+        return document_cls.objects
+    queryset_class = document_cls._meta.get('queryset_class', QuerySet)
+    return queryset_class(document_cls, _secondary_collection(document_cls))
@@ -0,0 +1,128 @@
+import math
+import re
+from bisect import bisect_left
+
+_TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+# Term-frequency weight of a hit in each product field
+FIELD_WEIGHTS = {'name': 3.0, 'category': 1.5, 'description': 1.0}
+PREFIX_FACTOR = 0.7
+FUZZY_FACTOR = 0.5
+
+
+def tokenize(text):
+    return _TOKEN_RE.findall((text or '').lower())
+
+
+def _within_one_edit(a, b):
+    """True if a and b differ by at most one insert, delete, substitution or adjacent swap."""
+    if a == b:
+        return True
+    la, lb = len(a), len(b)
+    if abs(la - lb) > 1:
+        return False
+    if la == lb:
+        diff = [i for i in range(la) if a[i] != b[i]]
+        if len(diff) == 1:
+            return True
+        return len(diff) == 2 and diff[1] == diff[0] + 1 and a[diff[0]] == b[diff[1]] and a[diff[1]] == b[diff[0]]
+    if la > lb:
+        a, b = b, a
+    i = 0
+    while i < len(a) and a[i] == b[i]:
+        i += 1
+    return a[i:] == b[i + 1:]
+
+
+class SearchIndex:
+    """In-memory inverted index with BM25 ranking over product name, category and description.
+    Query terms also match as prefixes ("zing" -> "zinger") and, when nothing else
+    matches, within one typo ("chiken" -> "chicken")."""
+
+    k1 = 1.2
+    b = 0.75
+
+    def __init__(self, docs):
+        """docs: iterable of (doc_id, {'name': ..., 'category': ..., 'description': ...})"""
+        self.postings = {}
+        self.doc_len = {}
+        self.position = {}
+        for doc_id, fields in docs:
+            length = 0.0
+            for field, weight in FIELD_WEIGHTS.items():
+                for term in tokenize(fields.get(field)):
+                    post = self.postings.setdefault(term, {})
+                    post[doc_id] = post.get(doc_id, 0.0) + weight
+                    length += weight
+            self.doc_len[doc_id] = length
+            self.position.setdefault(doc_id, len(self.position))
+        self.n_docs = len(self.doc_len)
+        self.avg_len = (sum(self.doc_len.values()) / self.n_docs) if self.n_docs else 0.0
+        # BM25 length normalisation only depends on the document, so compute it once
+        self._norm = {d: self.k1 * (1 - self.b + self.b * n / (self.avg_len or 1)) for d, n in self.doc_len.items()}
+        self.vocab = sorted(self.postings)
+        self._by_initial = {}
+        for term in self.vocab:
+            self._by_initial.setdefault(term[0], []).append(term)
+
+    def _expand(self, term):
+        """[(vocab term, factor)] that a query term should match."""
+        out = []
+        if term in self.postings:
+            out.append((term, 1.0))
+        if len(term) >= 2:
+            i = bisect_left(self.vocab, term)
+            while i < len(self.vocab) and self.vocab[i].startswith(term):
+                if self.vocab[i] != term:
+                    out.append((self.vocab[i], PREFIX_FACTOR))
+                i += 1
+        if not out and len(term) >= 4:
+            out = [(t, FUZZY_FACTOR) for t in self._by_initial.get(term[0], ())
+                   if abs(len(t) - len(term)) <= 1 and _within_one_edit(term, t)]
+        return out
+
+    def _idf(self, term):
+        df = len(self.postings[term])
+        return math.log(1 + (self.n_docs - df + 0.5) / (df + 0.5))
+
+    def scores(self, query, require_all=True):
+        """{doc_id: BM25 score}. With require_all, every query term must match something."""
+        terms = list(dict.fromkeys(tokenize(query)))
+        totals = None
+        for term in terms:
+            term_scores = {}
+            for vocab_term, factor in self._expand(term):
+                weight = factor * self._idf(vocab_term) * (self.k1 + 1)
+                for doc_id, tf in self.postings[vocab_term].items():
+                    s = weight * tf / (tf + self._norm[doc_id])
+                    if s > term_scores.get(doc_id, 0.0):
+                        term_scores[doc_id] = s
+            if require_all:
+                if not term_scores:
+                    return {}
+                totals = term_scores if totals is None else {
+                    d: totals[d] + s for d, s in term_scores.items() if d in totals}
+            else:
+                totals = totals or {}
+                for d, s in term_scores.items():
+                    totals[d] = totals.get(d, 0.0) + s
+        return totals or {}
+
+    def search(self, query, require_all=True, allowed=None):
+        """Doc ids ranked by relevance; ties keep index order. `allowed` optionally filters ids."""
+        scored = self.scores(query, require_all=require_all)
+        ranked = sorted(scored, key=lambda d: (-scored[d], self.position[d]))
+        if allowed is not None:
+            ranked = [d for d in ranked if d in allowed]
+        return ranked
+
+
+def paginate(items, page, per_page):
+    """Slice a list for a 1-based page number; returns (page_items, page, num_pages)."""
+    num_pages = max(1, math.ceil(len(items) / per_page))
+    try:
+        page = min(max(1, int(page)), num_pages)
+    except (TypeError, ValueError):
+        page = 1
+    start = (page - 1) * per_page
+    return items[start:start + per_page], page, num_pages
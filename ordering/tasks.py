@@ -0,0 +1,51 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+from .models import Order
+from .gemini_ai import get_gemini
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _worker_count():
+    try:
+        return max(1, int(getattr(settings, 'AI_WORKERS', 4)))
+    except Exception:
+        return 4
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=_worker_count(), thread_name_prefix='kfc-jobs')
+    return _executor
+
+
+def _run(fn, args, kwargs):
+    try:
+        fn(*args, **kwargs)
+    except Exception:
+        logger.exception('Background job %s failed', getattr(fn, '__name__', fn))
+
+
+def enqueue(fn, *args, **kwargs):
+    """Run fn(*args, **kwargs) on the shared background worker pool.
+    Returns immediately; failures are logged, never raised to the caller."""
+    return _get_executor().submit(_run, fn, args, kwargs)
+
+
+def analyze_order(order_id, customer_email=''):
+    """Fill in Order.gemini_analysis for an order placed at checkout."""
+    order = Order.objects(id=order_id).only('items', 'total_amount', 'gemini_analysis').first()
+    if not order or order.gemini_analysis:
+        return
+    analysis = get_gemini().analyze_kfc_order({'items': order.items, 'total': order.total_amount, 'customer': customer_email})
+    Order.objects(id=order_id).update_one(set__gemini_analysis=analysis)
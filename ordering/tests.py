@@ -0,0 +1,207 @@
+import datetime
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.test import SimpleTestCase, override_settings
+from mongoengine import connect, disconnect
+from mongoengine.connection import get_db
+from pymongo.read_preferences import SecondaryPreferred
+
+from . import routing
+from .apps import register_primary_connection
+from .inventory import reserve_stock
+from .models import Order, Product
+from .utils import _transition_delay, advance_due_orders, manual_status_update
+
+ALIAS = getattr(settings, 'MONGODB_ALIAS', 'default')
+
+
+class MongoTestCase(SimpleTestCase):
+    """Points the default connection alias at the MONGODB_TEST_URI database for the class and drops
+    it afterwards; skipped when that server is not reachable. The atomicity under test comes from
+    the server, not a mock."""
+
+    @classmethod
+    def setUpClass(cls):
+        # disconnect() also clears every document's cached collection, so nothing still points
+        # at the real database
+        disconnect(alias=ALIAS)
+        connect(alias=ALIAS, host=settings.MONGODB_TEST_URI,
+                serverSelectionTimeoutMS=getattr(settings, 'MONGODB_SERVER_SELECTION_TIMEOUT_MS', 5000))
+        cls.test_db = get_db(ALIAS)
+        if not cls.test_db.name.endswith('_test'):
+            cls._restore_connection()
+            raise ImproperlyConfigured("MONGODB_TEST_URI must name a database ending in '_test'")
+        try:
+            cls.test_db.client.admin.command('ping')
+        except Exception:
+            cls._restore_connection()
+            raise unittest.SkipTest('MongoDB at MONGODB_TEST_URI is not reachable')
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.test_db.client.drop_database(cls.test_db.name)
+        cls._restore_connection()
+        super().tearDownClass()
+
+    @classmethod
+    def _restore_connection(cls):
+        disconnect(alias=ALIAS)
+        register_primary_connection()
+
+    def setUp(self):
+        for name in self.test_db.list_collection_names():
+            self.test_db[name].delete_many({})
+
+
+class ReserveStockTests(MongoTestCase):
+
+    def _product(self, name, stock):
+        return Product._get_collection().insert_one(
+            {'name': name, 'price': 5.0, 'category': 'chicken', 'stock_quantity': stock, 'is_available': True}
+        ).inserted_id
+
+    def _stock(self, oid):
+        return Product._get_collection().find_one({'_id': oid}, {'stock_quantity': 1, 'is_available': 1})
+
+    def _hammer(self, carts, workers=32):
+        """Reserve every cart at once from many threads; returns the carts that got stock."""
+        start = threading.Event()
+
+        def attempt(cart):
+            start.wait()
+            reservation, errors = reserve_stock(cart)
+            return cart if reservation and not errors else None
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(attempt, cart) for cart in carts]
+            start.set()
+            return [f.result() for f in futures if f.result()]
+
+    def test_concurrent_reservations_never_oversell(self):
+        oid = self._product('Bucket', 25)
+        line = {'product_id': str(oid), 'name': 'Bucket', 'quantity': 1}
+        won = self._hammer([[line]] * 200)
+
+        doc = self._stock(oid)
+        self.assertEqual(len(won), 25)
+        self.assertEqual(doc['stock_quantity'], 0)
+        self.assertFalse(doc['is_available'])
+
+    def test_failed_line_gives_back_the_others(self):
+        plenty = self._product('Fries', 500)
+        scarce = self._product('Zinger', 10)
+        both = [{'product_id': str(plenty), 'name': 'Fries', 'quantity': 2},
+                {'product_id': str(scarce), 'name': 'Zinger', 'quantity': 1}]
+        won = self._hammer([both] * 100)
+
+        self.assertEqual(len(won), 10)
+        self.assertEqual(self._stock(scarce)['stock_quantity'], 0)
+        # Carts that lost the race on Zinger must not keep their Fries
+        self.assertEqual(self._stock(plenty)['stock_quantity'], 500 - 2 * len(won))
+        self.assertTrue(self._stock(plenty)['is_available'])
+
+    def test_insufficient_stock_is_rejected_without_writes(self):
+        oid = self._product('Wings', 2)
+        reservation, errors = reserve_stock([{'product_id': str(oid), 'name': 'Wings', 'quantity': 3}])
+
+        self.assertIsNone(reservation)
+        self.assertTrue(errors)
+        self.assertEqual(self._stock(oid)['stock_quantity'], 2)
+
+
+class ManualStatusTests(MongoTestCase):
+
+    def _order(self, status, due):
+        return Order._get_collection().insert_one(
+            {'order_number': 'T1', 'items': [{'name': 'Bucket', 'quantity': 1}], 'total_amount': 5.0,
+             'status': status, 'automation_started': True, 'next_transition_at': due}
+        ).inserted_id
+
+    def _status(self, oid):
+        return Order._get_collection().find_one({'_id': oid})
+
+    def test_moved_order_waits_for_its_new_due_time(self):
+        now = datetime.datetime.utcnow()
+        # Overdue for pending -> confirmed when staff move it straight to preparing
+        oid = self._order('pending', now - datetime.timedelta(seconds=30))
+        Order.objects(id=oid).update_one(**manual_status_update('preparing', now))
+
+        self.assertEqual(advance_due_orders(now + datetime.timedelta(seconds=1)), 0)
+        self.assertEqual(self._status(oid)['status'], 'preparing')
+
+        advance_due_orders(now + _transition_delay('ready') + datetime.timedelta(seconds=1))
+        self.assertEqual(self._status(oid)['status'], 'ready')
+
+    def test_cancelled_order_leaves_the_schedule(self):
+        now = datetime.datetime.utcnow()
+        oid = self._order('confirmed', now - datetime.timedelta(seconds=30))
+        Order.objects(id=oid).update_one(**manual_status_update('cancelled', now))
+
+        advance_due_orders(now + datetime.timedelta(days=1))
+        doc = self._status(oid)
+        self.assertEqual(doc['status'], 'cancelled')
+        self.assertNotIn('next_transition_at', doc)
+
+
+class FakeRequest:
+    def __init__(self):
+        self.session = {}
+
+
+class ReadRoutingTests(SimpleTestCase):
+    """Which collection reads() binds to; both connections are mocked, so no server is needed."""
+
+    def setUp(self):
+        routing._collections.clear()
+        self.addCleanup(routing._collections.clear)
+        self.primary = self._patch(mock.patch.object(Order, '_get_collection')).return_value
+        self.get_db = self._patch(mock.patch('ordering.routing.get_db'))
+        self.secondary = self.get_db.return_value.__getitem__.return_value
+
+    def _patch(self, patcher):
+        self.addCleanup(patcher.stop)
+        return patcher.start()
+
+    @override_settings(MONGODB_SECONDARY_READS=False)
+    def test_primary_when_replica_reads_are_off(self):
+        qs = routing.reads(Order, FakeRequest())
+
+        self.assertIs(qs._collection, self.primary)
+        self.get_db.assert_not_called()
+
+    @override_settings(MONGODB_SECONDARY_READS=True)
+    def test_secondary_when_enabled(self):
+        qs = routing.reads(Order, FakeRequest())
+
+        self.assertIs(qs._collection, self.secondary)
+        self.get_db.assert_called_once_with(routing.READ_ALIAS)
+        self.get_db.return_value.__getitem__.assert_called_once_with('kfc_orders')
+        # The document class itself stays bound to the primary
+        self.assertIs(Order.objects._collection, self.primary)
+
+    @override_settings(MONGODB_SECONDARY_READS=True, MONGODB_MAX_STALENESS_SECONDS=90)
+    def test_recent_write_reads_from_primary_until_the_window_ends(self):
+        request = FakeRequest()
+        routing.mark_write(request)
+
+        self.assertIs(routing.reads(Order, request)._collection, self.primary)
+        with mock.patch('ordering.routing.time.time', return_value=request.session[routing.SESSION_KEY] + 1):
+            self.assertIs(routing.reads(Order, request)._collection, self.secondary)
+
+
+@unittest.skipUnless(getattr(settings, 'MONGODB_SECONDARY_READS', False),
+                     'needs MONGODB_SECONDARY_READS=1 and a replica set (see README)')
+class ReplicaSetReadTests(SimpleTestCase):
+
+    def test_secondary_alias_prefers_secondaries(self):
+        collection = routing.reads(Order)._collection
+
+        self.assertIsInstance(collection.read_preference, SecondaryPreferred)
+        self.assertGreaterEqual(collection.read_preference.max_staleness, 90)
+        self.assertIsNot(collection, Order._get_collection())
@@ -14,6 +14,7 @@ urlpatterns = [
     path('orders/mine/', views.my_orders, name='my_orders'),
     path('receipts/mine/', views.my_receipts, name='my_receipts'),
     path('receipt/<str:order_number>/', views.receipt_view, name='receipt'),
+    path('receipt/<str:order_number>/text/', views.receipt_text_api, name='receipt_text_api'),
     path('accounts/signup/', views.signup, name='signup'),
     path('profile/', views.profile, name='profile'),
     path('avatar/<str:customer_id>/', views.customer_avatar, name='customer_avatar'),
@@ -30,6 +31,10 @@ urlpatterns = [
     path('kfc-admin/products/<str:product_id>/edit/', views.admin_edit_product, name='admin_edit_product'),
     path('kfc-admin/products/<str:product_id>/delete/', views.admin_delete_product, name='admin_delete_product'),
     path('kfc-admin/orders/', views.admin_orders, name='admin_orders'),
+    path('kfc-admin/kitchen/', views.admin_kitchen, name='admin_kitchen'),
+    path('kfc-admin/metrics/', views.admin_metrics, name='admin_metrics'),
+    path('kfc-admin/kitchen/board/', views.kitchen_board_api, name='kitchen_board_api'),
+    path('kfc-admin/kitchen/bulk-status/', views.kitchen_bulk_status, name='kitchen_bulk_status'),
     path('kfc-admin/analytics/', views.admin_analytics, name='admin_analytics'),
     path('kfc-admin/suggestions/', views.admin_suggestions, name='admin_suggestions'),
 ]
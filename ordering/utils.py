@@ -1,10 +1,12 @@
 import uuid
-from datetime import datetime
+from datetime import datetime, timedelta
+import logging
 import threading
-import time
 import os
 
 from .models import Order
+from .rollups import rollup_completed_orders
+from .tasks import enqueue
 
 
 def generate_order_number():
@@ -37,49 +39,127 @@ def _env_delays():
     }
 
 
-def _progress_order_status(order_id, delays=None):
-    steps = ['confirmed', 'preparing', 'ready', 'completed']
-    if delays is None:
-        delays = _env_delays()
-    speed = 1.0
+STATUS_FLOW = ['pending', 'confirmed', 'preparing', 'ready', 'completed']
+
+logger = logging.getLogger(__name__)
+
+
+def _env_speed():
     try:
         speed = float(os.getenv('ORDER_DELAY_SPEED', '1'))
-        if speed <= 0:
-            speed = 1.0
+        return speed if speed > 0 else 1.0
     except Exception:
-        speed = 1.0
-    try:
-        order = Order.objects(id=order_id).first()
-        if not order:
-            return
-        for status in steps:
-            # If order was cancelled or already completed, stop automation
-            order.reload()
-            if order.status in ['cancelled', 'completed']:
-                break
-            # Sleep before moving to next status
-            wait_s = max(0, int(delays.get(status, 5)))
-            time.sleep(wait_s / speed)
-            order.status = status
-            order.updated_at = datetime.utcnow()
-            order.save()
-    finally:
-        # Ensure flag is cleared when finished (optional: keep True to mark already automated)
-        try:
-            order = Order.objects(id=order_id).first()
-            if order and order.status in ['cancelled', 'completed']:
-                order.automation_started = True
-                order.save()
-        except Exception:
-            pass
+        return 1.0
+
+
+def _transition_delay(status, delays=None, speed=None):
+    """Time to wait before an order may move into `status`."""
+    if delays is None:
+        delays = _env_delays()
+    if speed is None:
+        speed = _env_speed()
+    return timedelta(seconds=max(0, int(delays.get(status, 5))) / speed)
+
+
+def advance_due_orders(now=None):
+    """Move every order whose next_transition_at has passed one step along STATUS_FLOW.
+    Each step is a single conditional update_many; returns the number of orders moved."""
+    now = now or datetime.utcnow()
+    delays = _env_delays()
+    speed = _env_speed()
+    moved = 0
+    # Walk the flow backwards so an order advances at most one step per tick
+    for i in range(len(STATUS_FLOW) - 2, -1, -1):
+        current, nxt = STATUS_FLOW[i], STATUS_FLOW[i + 1]
+        update = {'set__status': nxt, 'set__updated_at': now}
+        if i + 2 < len(STATUS_FLOW):
+            update['set__next_transition_at'] = now + _transition_delay(STATUS_FLOW[i + 2], delays, speed)
+        else:
+            update['unset__next_transition_at'] = True
+        count = Order.objects(status=current, next_transition_at__lte=now).update(**update)
+        if count and nxt == 'completed':
+            enqueue(rollup_completed_orders)
+        moved += count
+    return moved
+
+
+def manual_status_update(status, now=None):
+    """update() kwargs for a status set by hand. next_transition_at is re-armed in the same write,
+    so the scheduler waits the full delay for the next step (or stops once there is none) instead
+    of acting on the due time left over from the old status."""
+    now = now or datetime.utcnow()
+    update = {'set__status': status, 'set__updated_at': now}
+    if status in STATUS_FLOW[:-1]:
+        update['set__next_transition_at'] = now + _transition_delay(STATUS_FLOW[STATUS_FLOW.index(status) + 1])
+    else:
+        update['unset__next_transition_at'] = True
+    return update
+
+
+def _next_due_at():
+    order = (Order.objects(status__in=STATUS_FLOW[:-1], next_transition_at__ne=None)
+             .order_by('next_transition_at').only('next_transition_at').first())
+    return order.next_transition_at if order else None
+
+
+class OrderScheduler:
+    """One background thread per process that advances order statuses.
+    State lives in Order.next_transition_at, so pending transitions survive restarts."""
+
+    def __init__(self, max_sleep=5.0, min_sleep=0.2):
+        self.max_sleep = max_sleep
+        self.min_sleep = min_sleep
+        self._thread = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+
+    def start(self):
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='kfc-order-scheduler', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def wake(self):
+        self._wake.set()
+
+    def _sleep_for(self):
+        due = _next_due_at()
+        if due is None:
+            return self.max_sleep
+        wait_s = (due - datetime.utcnow()).total_seconds()
+        return min(self.max_sleep, max(self.min_sleep, wait_s))
+
+    def _run(self):
+        while not self._stop.is_set():
+            wait_s = self.max_sleep
+            try:
+                advance_due_orders()
+                wait_s = self._sleep_for()
+            except Exception:
+                logger.exception('Order scheduler tick failed')
+            self._wake.wait(wait_s)
+            self._wake.clear()
+
+
+order_scheduler = OrderScheduler(max_sleep=float(os.getenv('ORDER_SCHEDULER_INTERVAL', '5') or 5))
 
 
 def start_order_automation(order):
-    """Start background automation to progress an order's status.
+    """Schedule an order to progress from pending to completed over time.
     Safe to call multiple times; it will only start once per order."""
     if getattr(order, 'automation_started', False):
         return
+    due = datetime.utcnow() + _transition_delay(STATUS_FLOW[1])
+    Order.objects(id=order.id, automation_started__ne=True).update_one(
+        set__automation_started=True, set__next_transition_at=due)
     order.automation_started = True
-    order.save()
-    t = threading.Thread(target=_progress_order_status, args=(order.id,), daemon=True)
-    t.start()
+    order.next_transition_at = due
+    order_scheduler.start()
+    order_scheduler.wake()
@@ -1,27 +1,58 @@
 from django.shortcuts import render, redirect
-from django.http import HttpResponse, Http404, JsonResponse
+from django.conf import settings
+from django.http import Http404, JsonResponse, StreamingHttpResponse
 from django.views.decorators.http import require_POST
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth import login as auth_login
+from django.contrib import messages
 from bson import ObjectId
 from mongoengine.queryset.visitor import Q
+import datetime
 import json
+import queue
 import re
+import threading
+import time
 
 from .models import Product, Customer, Order, Receipt, Suggestion
 from .forms import CheckoutForm, ProductForm, ProfileForm, SuggestionForm
-from .utils import generate_order_number, generate_receipt_number, cart_total, start_order_automation
-from .gemini_ai import KFCGeminiAI
+from .utils import generate_order_number, manual_status_update, start_order_automation
+from .gemini_ai import get_gemini, gemini_metrics
+from .ai_cache import response_cache
+from .middleware import query_metrics
+from .tasks import enqueue, analyze_order
+from .inventory import reserve_stock, release_stock
+from .metrics import dashboard_metrics
+from .rollups import rollup_completed_orders, sales_summary
+from .media import gridfs_response
+from .catalog import get_catalog, catalog_cache, stock_levels
+from .search import paginate
+from . import carts
+from .pricing import price_cart
+from .receipts import PENDING_FOR, ensure_receipt, receipt_pending
+from .backfill import backfill_customer_names, backfill_status
+from .menu_context import menu_context
+from .pagination import keyset_page
+from .routing import reads, mark_write
+from .live import order_hub, order_payload, long_poll_slots, STATUS_FIELDS
+from .images import VARIANT_SIZES, AVATAR_SIZES, variant_proxy, delete_variants, generate_variants
+
+
+MENU_PAGE_SIZE = 24
+ADMIN_ORDERS_PAGE_SIZE = 50
 
 
 def is_staff(user):
     return user.is_authenticated and user.is_staff
 
 
-def _get_cart(request):
-    cart = request.session.get('cart', {})
-    return cart
+def _priced_cart(request, lines=None):
+    """Price the caller's cart and write back any stock or availability corrections."""
+    priced = price_cart(carts.get_lines(request) if lines is None else lines)
+    if priced.changes:
+        carts.set_lines(request, priced.changes)
+    return priced
 
 
 def _key_email_for_user(user):
@@ -29,104 +60,79 @@ def _key_email_for_user(user):
 
 
 def _customers_for_user(user):
+    """Customers that belong to a signed-in user: linked by user_id, or carrying the account's own
+    email (linked on first sight). One indexed query. Customers sharing only a phone or name are
+    never matched here; link_customer_identities --claim-by-phone-and-name links them explicitly."""
     if not user or not user.is_authenticated:
         return []
     key_email = _key_email_for_user(user)
-    emails = set()
-    if key_email:
-        emails.add(key_email)
-    if getattr(user, 'email', None):
-        emails.add(user.email)
-    # Find a primary customer to extract phone (if any)
-    primary = Customer.objects(email__in=list(emails)).first()
-    phone = primary.phone if primary and primary.phone else None
-    uname = user.get_username() or None
-    query = Q(email__in=list(emails))
-    if phone:
-        query = query | Q(phone=phone)
-    if uname:
-        query = query | Q(name__iexact=uname)
-    return list(Customer.objects(query))
-
-
-def _save_cart(request, cart):
-    request.session['cart'] = cart
-    request.session.modified = True
+    emails = {e for e in (key_email, getattr(user, 'email', None)) if e}
+    customers = list(Customer.objects(Q(user_id=user.id) | Q(email__in=list(emails), user_id=None)))
+    unlinked = [c.id for c in customers if c.user_id is None]
+    if unlinked:
+        Customer.objects(id__in=unlinked, user_id=None).update(set__user_id=user.id)
+    return customers
 
 
 def menu(request):
     query = request.GET.get('q', '')
     category = request.GET.get('category')
-    q = Q(is_available=True)
+    catalog = get_catalog()
+    products = catalog.category(category) if category else catalog.available
     if query:
-        q &= (Q(name__icontains=query) | Q(description__icontains=query))
-    if category:
-        q &= Q(category=category)
-    products = Product.objects(q).order_by('-created_at')
+        allowed = {str(p.id) for p in products} if category else None
+        products = [catalog.get(pid) for pid in catalog.search_index.search(query, allowed=allowed)]
+    products, page, num_pages = paginate(products, request.GET.get('page', 1), MENU_PAGE_SIZE)
     categories = ['chicken', 'burgers', 'sides', 'drinks', 'desserts']
     return render(request, 'kfc/customers/menu.html', {
         'products': products,
         'query': query,
         'category': category,
         'categories': categories,
+        'page': page,
+        'num_pages': num_pages,
     })
 
 
 def product_image(request, product_id):
     try:
-        product = Product.objects.get(id=ObjectId(product_id))
+        product = Product.objects.only('image', 'image_variants').get(id=ObjectId(product_id))
     except Exception:
         raise Http404()
     if not product.image:
         raise Http404()
-    gridout = product.image.get()
-    content = gridout.read()
-    content_type = getattr(gridout, 'content_type', 'application/octet-stream')
-    return HttpResponse(content, content_type=content_type)
+    size = request.GET.get('size')
+    if size not in VARIANT_SIZES:
+        size = None
+    return gridfs_response(request, variant_proxy(product.image, product.image_variants, size))
 
 @require_POST
 def add_to_cart(request, product_id):
     qty = max(1, int(request.POST.get('quantity', '1')))
-    try:
-        product = Product.objects.get(id=ObjectId(product_id))
-    except Exception:
+    product = get_catalog().get(product_id)
+    if not product:
         raise Http404()
+    pid = str(product.id)
+    stock = stock_levels([pid]).get(pid, 0)
     # If out of stock or not available, ignore add
-    if not product.is_available or int(product.stock_quantity or 0) <= 0:
+    if not product.is_available or stock <= 0:
         return redirect('view_cart')
-    cart = _get_cart(request)
-    pid = str(product.id)
-    current_qty = int(cart.get(pid, {}).get('quantity', 0))
-    max_addable = max(0, int(product.stock_quantity or 0) - current_qty)
+    current_qty = carts.get_lines(request).get(pid, 0)
+    max_addable = max(0, stock - current_qty)
     if max_addable <= 0:
         return redirect('view_cart')
-    add_qty = min(qty, max_addable)
-    item = cart.get(pid, {'name': product.name, 'price': float(product.price), 'quantity': 0})
-    item['quantity'] = int(item['quantity']) + add_qty
-    cart[pid] = item
-    _save_cart(request, cart)
+    carts.add_line(request, pid, min(qty, max_addable))
     return redirect('view_cart')
 
 
 def view_cart(request):
-    cart = _get_cart(request)
-    items = []
-    total = 0.0
-    for pid, item in cart.items():
-        subtotal = float(item['price']) * int(item['quantity'])
-        total += subtotal
-        items.append({
-            'product_id': pid,
-            'name': item['name'],
-            'price': float(item['price']),
-            'quantity': int(item['quantity']),
-            'subtotal': subtotal,
-        })
-    return render(request, 'kfc/customers/cart.html', {'items': items, 'total': total})
+    priced = _priced_cart(request)
+    return render(request, 'kfc/customers/cart.html', {'items': priced.items, 'total': priced.total, 'issues': priced.issues})
 
 @require_POST
 def update_cart(request):
-    cart = _get_cart(request)
+    lines = carts.get_lines(request)
+    updates = {}
     for pid, qty in request.POST.items():
         if not pid.startswith('qty_'):
             continue
@@ -135,37 +141,32 @@ def update_cart(request):
             qty_val = max(0, int(qty))
         except ValueError:
             qty_val = 0
-        # Cap by stock if product exists
-        try:
-            prod = Product.objects.get(id=ObjectId(pid_real))
-            if prod and prod.stock_quantity is not None:
-                qty_val = min(qty_val, int(prod.stock_quantity))
-        except Exception:
-            pass
-        if qty_val <= 0:
-            cart.pop(pid_real, None)
-        else:
-            if pid_real in cart:
-                cart[pid_real]['quantity'] = qty_val
-    _save_cart(request, cart)
+        if pid_real in lines:
+            updates[pid_real] = qty_val
+    # Stock caps for every submitted line come from one pricing query
+    priced = price_cart({pid: qty for pid, qty in updates.items() if qty > 0})
+    updates.update(priced.changes)
+    carts.set_lines(request, updates)
     return redirect('view_cart')
 
 
 @login_required
 def checkout(request):
-    cart = _get_cart(request)
-    if not cart:
+    priced = _priced_cart(request)
+    if not priced:
         return redirect('menu')
-    items = [{
-        'product_id': pid,
-        'name': item['name'],
-        'quantity': item['quantity'],
-        'price': item['price'],
-    } for pid, item in cart.items()]
-    total = cart_total(items)
+    items = priced.order_items()
+    total = priced.total
 
     if request.method == 'POST':
         form = CheckoutForm(request.POST)
+        if priced.issues or request.POST.get('quote') != priced.quote():
+            # Prices, stock or availability moved since the checkout page was shown; let the
+            # customer see the new cart before charging anything
+            messages.warning(request, ' '.join(priced.issues) or (
+                f'Prices in your cart changed since you opened checkout. Your total is now ${total:.2f}; '
+                'please check it before placing your order.'))
+            return redirect('view_cart')
         if form.is_valid():
             # Determine customer identity
             user = request.user if hasattr(request, 'user') else None
@@ -180,15 +181,19 @@ def checkout(request):
                 cust_name = 'Guest'
 
             customer = Customer.objects(email=cust_email).first()
+            user_id = user.id if user and user.is_authenticated else None
             if not customer:
                 customer = Customer(
                     name=cust_name,
                     email=cust_email,
                     phone=form.cleaned_data.get('phone', ''),
                     address=form.cleaned_data.get('address', ''),
+                    user_id=user_id,
                 )
                 customer.save()
             else:
+                if user_id and not customer.user_id:
+                    customer.user_id = user_id
                 # Update latest phone/address
                 customer.phone = form.cleaned_data.get('phone', customer.phone)
                 # If name is missing or generic, set it to the authenticated username
@@ -199,20 +204,8 @@ def checkout(request):
                 if form.cleaned_data.get('address'):
                     customer.address = form.cleaned_data.get('address')
                 customer.save()
-            # Stock validation and decrement
-            insufficient = []
-            products_to_update = []
-            for it in items:
-                try:
-                    prod = Product.objects.get(id=ObjectId(it['product_id']))
-                except Exception:
-                    insufficient.append(f"Product not found: {it['name']}")
-                    continue
-                qty = int(it['quantity'])
-                if prod.stock_quantity is not None and prod.stock_quantity < qty:
-                    insufficient.append(f"Not enough stock for {prod.name} (have {prod.stock_quantity}, need {qty})")
-                else:
-                    products_to_update.append((prod, qty))
+            # Reserve stock for all lines in one batched, conditional write
+            reservation, insufficient = reserve_stock(items)
             if insufficient:
                 # Show error on checkout page
                 error_msg = "; ".join(insufficient)
@@ -220,20 +213,10 @@ def checkout(request):
                     'form': form,
                     'items': items,
                     'total': total,
+                    'quote': priced.quote(),
                     'error': error_msg,
                 })
 
-            # Decrement stock
-            for prod, qty in products_to_update:
-                try:
-                    prod.stock_quantity = int(prod.stock_quantity or 0) - qty
-                    if prod.stock_quantity <= 0:
-                        prod.stock_quantity = 0
-                        prod.is_available = False
-                    prod.save()
-                except Exception:
-                    pass
-
             order = Order(
                 order_number=generate_order_number(),
                 customer=customer,
@@ -241,13 +224,17 @@ def checkout(request):
                 total_amount=total,
                 special_instructions='',
             )
-            order.save()
+            try:
+                order.save()
+            except Exception:
+                release_stock(reservation)
+                raise
+            # History pages read from secondaries; keep this visitor on the primary until they catch up
+            mark_write(request)
 
-            # AI analysis
-            ai = KFCGeminiAI()
-            analysis = ai.analyze_kfc_order({'items': items, 'total': total, 'customer': customer.email})
-            order.gemini_analysis = analysis
-            order.save()
+            # AI analysis and receipt text run off the request path; pages pick them up once ready
+            enqueue(analyze_order, order.id, customer.email)
+            ensure_receipt(order)
 
             # Start background automation to move status from pending -> completed over time
             try:
@@ -256,7 +243,7 @@ def checkout(request):
                 pass
 
             # Clear cart
-            _save_cart(request, {})
+            carts.clear(request)
             return redirect('order_success', order_number=order.order_number)
     else:
         # Prefill phone from profile if available
@@ -269,7 +256,8 @@ def checkout(request):
                 initial['phone'] = cust.phone
         form = CheckoutForm(initial=initial)
 
-    return render(request, 'kfc/customers/checkout.html', {'form': form, 'items': items, 'total': total})
+    return render(request, 'kfc/customers/checkout.html', {
+        'form': form, 'items': items, 'total': total, 'quote': priced.quote(), 'error': ' '.join(priced.issues)})
 
 
 def order_success(request, order_number):
@@ -279,34 +267,43 @@ def order_success(request, order_number):
     return render(request, 'kfc/customers/order_success.html', {'order': order})
 
 
+HISTORY_PAGE_SIZE = 20
+HISTORY_FIELDS = ('order_number', 'created_at', 'status', 'total_amount')
+
+
 def order_history(request):
     email = request.GET.get('email')
-    orders = []
+    orders, next_cursor = [], None
     if email:
-        cust = Customer.objects(email=email).first()
+        cust = Customer.objects(email=email).only('id').first()
         if cust:
-            orders = Order.objects(customer=cust).order_by('-created_at')
-    return render(request, 'kfc/customers/order_history.html', {'orders': orders, 'email': email or ''})
+            qs = reads(Order, request)(customer=cust).only(*HISTORY_FIELDS)
+            orders, next_cursor = keyset_page(qs, request.GET.get('cursor'), per_page=HISTORY_PAGE_SIZE)
+    return render(request, 'kfc/customers/order_history.html', {
+        'orders': orders, 'email': email or '',
+        'next_cursor': next_cursor, 'is_first_page': not request.GET.get('cursor'),
+    })
 
 @login_required
 def my_orders(request):
     user = request.user
     customers = _customers_for_user(user)
-    orders = Order.objects(customer__in=customers).order_by('-created_at') if customers else []
-    return render(request, 'kfc/customers/order_history.html', {'orders': orders, 'email': user.email if user.email else ''})
+    orders, next_cursor = [], None
+    if customers:
+        qs = reads(Order, request)(customer__in=[c.id for c in customers]).only(*HISTORY_FIELDS)
+        orders, next_cursor = keyset_page(qs, request.GET.get('cursor'), per_page=HISTORY_PAGE_SIZE)
+    return render(request, 'kfc/customers/order_history.html', {
+        'orders': orders, 'email': user.email if user.email else '',
+        'next_cursor': next_cursor, 'is_first_page': not request.GET.get('cursor'),
+    })
 
 
 def receipt_view(request, order_number):
     order = Order.objects(order_number=order_number).first()
     if not order:
         raise Http404()
-    # Generate or fetch receipt
-    receipt = Receipt.objects(order=order).first()
-    if not receipt:
-        ai = KFCGeminiAI()
-        receipt_text = ai.generate_kfc_receipt({'order_number': order.order_number, 'total': order.total_amount, 'items': order.items})
-        receipt = Receipt(order=order, receipt_number=generate_receipt_number(), receipt_data={'text': receipt_text})
-        receipt.save()
+    # Created at checkout; older orders get their template receipt here. Never waits on the AI text.
+    receipt = ensure_receipt(order)
     cust = order.customer
     avatar_url = 'https://via.placeholder.com/64x64?text=Me'
     if cust and getattr(cust, 'avatar', None):
@@ -314,7 +311,7 @@ def receipt_view(request, order_number):
             # Only use avatar URL if a file is stored
             grid_id = getattr(cust.avatar, 'grid_id', None)
             if grid_id:
-                avatar_url = f"/avatar/{cust.id}/"
+                avatar_url = cust.avatar_thumb_url
         except Exception:
             pass
     email_display = ''
@@ -329,18 +326,58 @@ def receipt_view(request, order_number):
         'customer_email_display': email_display,
         'customer_phone_display': phone_display,
         'customer_name_display': name_display,
+        'receipt_pending': receipt_pending(receipt),
+        'receipt_wait_ms': int(PENDING_FOR.total_seconds() * 1000),
     })
 
 
+def receipt_text_api(request, order_number):
+    order = Order.objects(order_number=order_number).only('id').first()
+    receipt = Receipt.objects(order=order.id).only('receipt_data').first() if order else None
+    if not receipt:
+        raise Http404()
+    return JsonResponse({'text': (receipt.receipt_data or {}).get('text', ''), 'pending': receipt_pending(receipt)})
+
+
 def order_status_api(request, order_number):
-    order = Order.objects(order_number=order_number).first()
-    if not order:
-        return JsonResponse({'error': 'not_found'}, status=404)
-    return JsonResponse({
-        'order_number': order.order_number,
-        'status': order.status,
-        'updated_at': order.updated_at.isoformat() if order.updated_at else None,
-    })
+    """Status and AI analysis of an order. With ?wait=1 this is a long-poll: it answers as soon as
+    either differs from what the caller already shows (?status=, ?analysis=0|1), or with the unchanged
+    state after ORDER_LONG_POLL_SECONDS, so a watching page holds a worker thread only briefly."""
+    coll = Order._get_collection()
+    if request.GET.get('wait') != '1' or not long_poll_slots.acquire(blocking=False):
+        doc = coll.find_one({'order_number': order_number}, STATUS_FIELDS)
+        if not doc:
+            return JsonResponse({'error': 'not_found'}, status=404)
+        # waited=False tells a long-polling page to fall back to a plain poll interval
+        return JsonResponse(dict(order_payload(doc), waited=False))
+    # Pages that do not show the analysis leave ?analysis= out and only wait for status changes
+    track_analysis = 'analysis' in request.GET
+    known = (request.GET.get('status') or '', request.GET.get('analysis') == '1' if track_analysis else None)
+    # Subscribe before reading the current state so no transition is missed
+    q = order_hub.subscribe(order_number)
+    try:
+        doc = coll.find_one({'order_number': order_number}, STATUS_FIELDS)
+        if not doc:
+            return JsonResponse({'error': 'not_found'}, status=404)
+        payload = order_payload(doc)
+        deadline = time.monotonic() + float(getattr(settings, 'ORDER_LONG_POLL_SECONDS', 20))
+        while (payload['status'], bool(payload['gemini_analysis']) if track_analysis else None) == known:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                payload = q.get(timeout=remaining)
+            except queue.Empty:
+                break
+    finally:
+        order_hub.unsubscribe(order_number, q)
+        long_poll_slots.release()
+    return JsonResponse(dict(payload, waited=True))
+
+
+def _sse(payload):
+    return f"data: {json.dumps(payload)}\n\n"
+
 
 @login_required
 def profile(request):
@@ -349,7 +386,7 @@ def profile(request):
     key_email = _key_email_for_user(user)
     cust = Customer.objects(email=key_email).first()
     if not cust:
-        cust = Customer(name=user.get_username() or 'Customer', email=key_email)
+        cust = Customer(name=user.get_username() or 'Customer', email=key_email, user_id=user.id)
         cust.save()
     if request.method == 'POST':
         form = ProfileForm(request.POST, request.FILES)
@@ -365,8 +402,12 @@ def profile(request):
                         cust.avatar.delete()
                     except Exception:
                         pass
+                delete_variants(cust.avatar, cust.avatar_variants)
+                cust.avatar_variants = {}
                 cust.avatar.put(avatar, content_type=avatar.content_type, filename=avatar.name)
             cust.save()
+            if avatar:
+                enqueue(generate_variants, Customer, cust.id, 'avatar', 'avatar_variants', AVATAR_SIZES)
             return redirect('profile')
     else:
         initial = {'phone': cust.phone if cust else ''}
@@ -375,10 +416,10 @@ def profile(request):
     customers = _customers_for_user(user)
     if cust and cust not in customers:
         customers.append(cust)
-    orders_qs = Order.objects(customer__in=customers) if customers else Order.objects.none()
+    orders_qs = reads(Order, request)(customer__in=customers) if customers else Order.objects.none()
     completed_count = orders_qs.filter(status='completed').count() if customers else 0
     in_progress_count = orders_qs.filter(status__in=['pending','confirmed','preparing','ready']).count() if customers else 0
-    total_spent = sum(o.total_amount for o in orders_qs) if customers else 0
+    total_spent = orders_qs.sum('total_amount') if customers else 0
     return render(request, 'kfc/customers/profile.html', {
         'form': form,
         'customer': cust,
@@ -389,13 +430,15 @@ def profile(request):
 
 def customer_avatar(request, customer_id):
     try:
-        c = Customer.objects.get(id=ObjectId(customer_id))
+        c = Customer.objects.only('avatar', 'avatar_variants').get(id=ObjectId(customer_id))
     except Exception:
         raise Http404()
     if not c.avatar:
         raise Http404()
-    gridout = c.avatar.get()
-    return HttpResponse(gridout.read(), content_type=getattr(gridout, 'content_type', 'image/jpeg'))
+    size = request.GET.get('size')
+    if size not in AVATAR_SIZES:
+        size = None
+    return gridfs_response(request, variant_proxy(c.avatar, c.avatar_variants, size), default_content_type='image/jpeg')
 
 
 def suggest_product(request):
@@ -448,6 +491,8 @@ def admin_suggestions(request):
                     except Exception:
                         pass
                 p.save()
+                if p.image:
+                    enqueue(generate_variants, Product, p.id)
                 s.status = 'approved'
             else:
                 s.status = 'rejected'
@@ -458,13 +503,20 @@ def admin_suggestions(request):
 
 @login_required
 def my_receipts(request):
-    user = request.user
-    key_email = user.email or (f"user-{getattr(user, 'id', '') or user.get_username()}@kfc.local")
-    cust = Customer.objects(email=key_email).first()
-    orders = Order.objects(customer=cust) if cust else []
-    receipts = Receipt.objects(order__in=list(orders)).order_by('-generated_at') if orders else []
+    customers = _customers_for_user(request.user)
+    receipts, next_cursor = [], None
+    if customers:
+        qs = reads(Receipt, request)(customer__in=[c.id for c in customers]).no_dereference()
+        receipts, next_cursor = keyset_page(qs, request.GET.get('cursor'), per_page=HISTORY_PAGE_SIZE, field='generated_at')
+        # One $in lookup for the page's orders instead of dereferencing each receipt
+        order_ids = [r.order.id for r in receipts if r.order]
+        orders = {o.id: o for o in reads(Order, request)(id__in=order_ids).only('order_number', 'total_amount')} if order_ids else {}
+        for r in receipts:
+            r.order_info = orders.get(r.order.id) if r.order else None
     return render(request, 'kfc/customers/receipts_list.html', {
         'receipts': receipts,
+        'next_cursor': next_cursor,
+        'is_first_page': not request.GET.get('cursor'),
     })
 
 def signup(request):
@@ -484,16 +536,7 @@ def signup(request):
 @login_required
 @user_passes_test(is_staff)
 def admin_dashboard(request):
-    total_orders = Order.objects.count()
-    completed = Order.objects(status='completed').count()
-    pending = Order.objects(status='pending').count()
-    revenue = sum(o.total_amount for o in Order.objects())
-    return render(request, 'kfc/admin/dashboard.html', {
-        'total_orders': total_orders,
-        'completed': completed,
-        'pending': pending,
-        'revenue': revenue,
-    })
+    return render(request, 'kfc/admin/dashboard.html', dashboard_metrics())
 
 @login_required
 @user_passes_test(is_staff)
@@ -520,6 +563,8 @@ def admin_upload_product(request):
                 # store in GridFS
                 p.image.put(file, content_type=file.content_type, filename=file.name)
             p.save()
+            if file:
+                enqueue(generate_variants, Product, p.id)
             return redirect('admin_products')
     else:
         form = ProductForm()
@@ -549,11 +594,15 @@ def admin_edit_product(request, product_id):
                         p.image.delete()
                     except Exception:
                         pass
+                delete_variants(p.image, p.image_variants)
+                p.image_variants = {}
                 p.image.put(file, content_type=file.content_type, filename=file.name)
             # Auto-toggle availability when stock zero
             if p.stock_quantity <= 0:
                 p.is_available = False
             p.save()
+            if file:
+                enqueue(generate_variants, Product, p.id)
             return redirect('admin_products')
     else:
         initial = {
@@ -579,6 +628,7 @@ def admin_delete_product(request, product_id):
         raise Http404()
     try:
         if p.image:
+            delete_variants(p.image, p.image_variants)
             p.image.delete()
     except Exception:
         pass
@@ -591,40 +641,38 @@ def admin_orders(request):
     if request.method == 'POST':
         action = request.POST.get('action')
         if action == 'backfill_names':
-            # Heuristic backfill: set customer.name if placeholder
-            customers = Customer.objects()
-            # Build phone->best_name map from customers with real names
-            phone_name = {}
-            for c in customers:
-                nm = (getattr(c, 'name', '') or '').strip()
-                if nm and nm.lower() not in ['guest', 'customer'] and getattr(c, 'phone', None):
-                    phone_name[c.phone] = nm
-            for c in customers:
-                try:
-                    nm = (getattr(c, 'name', '') or '').strip().lower()
-                    if nm and nm not in ['guest', 'customer']:
-                        continue
-                    email = (getattr(c, 'email', '') or '').strip()
-                    new_name = None
-                    # If real email, take local-part
-                    if email and not email.endswith('@kfc.local') and '@' in email:
-                        new_name = email.split('@', 1)[0]
-                    # Else if phone matches a known named customer, copy
-                    if not new_name and getattr(c, 'phone', None) and c.phone in phone_name:
-                        new_name = phone_name[c.phone]
-                    if new_name:
-                        c.name = new_name
-                        c.save()
-                except Exception:
-                    pass
+            # Runs on the job pool; progress is shown below from its JobRun document
+            enqueue(backfill_customer_names)
+            return redirect('admin_orders')
         else:
             order_id = request.POST.get('order_id')
             status = request.POST.get('status')
-            order = Order.objects(id=order_id).first()
-            if order and status in ['pending','confirmed','preparing','ready','completed','cancelled']:
-                order.status = status
-                order.save()
-    orders = Order.objects().order_by('-created_at')
+            if ObjectId.is_valid(order_id or '') and status in ORDER_STATUSES:
+                Order.objects(id=order_id).update_one(**manual_status_update(status))
+                mark_write(request)
+                if status == 'completed':
+                    enqueue(rollup_completed_orders)
+    status_list = ORDER_STATUSES
+    status_filter = request.GET.get('status') or ''
+    date_from = request.GET.get('from') or ''
+    date_to = request.GET.get('to') or ''
+    filters = {}
+    if status_filter in status_list:
+        filters['status'] = status_filter
+    try:
+        if date_from:
+            filters['created_at__gte'] = datetime.datetime.strptime(date_from, '%Y-%m-%d')
+        if date_to:
+            filters['created_at__lt'] = datetime.datetime.strptime(date_to, '%Y-%m-%d') + datetime.timedelta(days=1)
+    except ValueError:
+        pass
+    # Only the columns the table shows; customers are resolved below in one query
+    qs = (reads(Order, request)(**filters)
+          .only('order_number', 'customer', 'status', 'total_amount', 'created_at')
+          .no_dereference())
+    orders, next_cursor = keyset_page(qs, request.GET.get('cursor'), per_page=ADMIN_ORDERS_PAGE_SIZE)
+    customer_ids = {getattr(o.customer, 'id', o.customer) for o in orders if o.customer}
+    customers = {c.id: c for c in reads(Customer, request)(id__in=list(customer_ids)).only('name', 'email')} if customer_ids else {}
     def _display_name(cust):
         try:
             name = (getattr(cust, 'name', '') or '').strip()
@@ -642,25 +690,109 @@ def admin_orders(request):
     # Attach display_name for template use without changing DB
     for o in orders:
         try:
-            o.display_name = _display_name(o.customer)
+            o.display_name = _display_name(customers.get(getattr(o.customer, 'id', o.customer)))
         except Exception:
             o.display_name = 'Customer'
-    status_list = ['pending','confirmed','preparing','ready','completed','cancelled']
-    return render(request, 'kfc/admin/orders.html', {'orders': orders, 'status_list': status_list})
+    return render(request, 'kfc/admin/orders.html', {
+        'orders': orders,
+        'status_list': status_list,
+        'status_filter': status_filter,
+        'date_from': date_from,
+        'date_to': date_to,
+        'next_cursor': next_cursor,
+        'is_first_page': not request.GET.get('cursor'),
+        'backfill': backfill_status(),
+    })
+
+KITCHEN_STATUSES = ['pending', 'confirmed', 'preparing', 'ready']
+ORDER_STATUSES = KITCHEN_STATUSES + ['completed', 'cancelled']
+
+
+@login_required
+@user_passes_test(is_staff)
+def admin_kitchen(request):
+    return render(request, 'kfc/admin/kitchen.html', {'lanes': KITCHEN_STATUSES})
+
+
+@login_required
+@user_passes_test(is_staff)
+def kitchen_board_api(request):
+    """Active orders for the kitchen board. With ?since=<iso watermark> only orders changed
+    at or after it are returned (including ones that left the board)."""
+    since = request.GET.get('since')
+    fields = ('order_number', 'status', 'items', 'created_at', 'updated_at')
+    try:
+        since_dt = datetime.datetime.fromisoformat(since) if since else None
+    except ValueError:
+        return JsonResponse({'error': 'bad_since'}, status=400)
+    if since_dt:
+        qs = Order.objects(status__in=ORDER_STATUSES, updated_at__gte=since_dt)
+    else:
+        qs = Order.objects(status__in=KITCHEN_STATUSES)
+    orders = []
+    watermark = since_dt
+    for o in qs.only(*fields).order_by('updated_at').as_pymongo():
+        updated_at = o.get('updated_at')
+        if updated_at and (watermark is None or updated_at > watermark):
+            watermark = updated_at
+        orders.append({
+            'id': str(o['_id']),
+            'order_number': o.get('order_number'),
+            'status': o.get('status'),
+            'items': [{'name': i.get('name'), 'quantity': i.get('quantity')} for i in o.get('items') or []],
+            'created_at': o['created_at'].isoformat() if o.get('created_at') else None,
+            'updated_at': updated_at.isoformat() if updated_at else None,
+        })
+    return JsonResponse({'orders': orders, 'watermark': watermark.isoformat() if watermark else None})
+
+
+@login_required
+@user_passes_test(is_staff)
+@require_POST
+def kitchen_bulk_status(request):
+    """Move many orders to one status in a single update_many.
+    Body: {"order_ids": [...], "status": "...", "from_status": optional guard}"""
+    try:
+        payload = json.loads(request.body.decode('utf-8') or '{}')
+    except Exception:
+        payload = {}
+    status = payload.get('status')
+    from_status = payload.get('from_status')
+    ids = [ObjectId(i) for i in payload.get('order_ids') or [] if ObjectId.is_valid(str(i))]
+    if status not in ORDER_STATUSES or not ids:
+        return JsonResponse({'error': 'bad_request'}, status=400)
+    filters = {'id__in': ids}
+    if from_status in ORDER_STATUSES:
+        filters['status'] = from_status
+    updated = Order.objects(**filters).update(**manual_status_update(status))
+    if updated and status == 'completed':
+        enqueue(rollup_completed_orders)
+    return JsonResponse({'updated': updated})
+
+
+@login_required
+@user_passes_test(is_staff)
+def admin_metrics(request):
+    """Process-local health numbers for alerting (Gemini breaker state, cache hit rates)."""
+    return JsonResponse({
+        'gemini': gemini_metrics(),
+        'ai_cache': response_cache.stats(),
+        'catalog': catalog_cache.stats(),
+        'mongo_by_view': query_metrics(),
+    })
+
 
 @login_required
 @user_passes_test(is_staff)
 def admin_analytics(request):
-    ai = KFCGeminiAI()
-    sales_data = [{
-        'order_number': o.order_number,
-        'total': o.total_amount,
-        'status': o.status,
-        'created_at': o.created_at.isoformat(),
-    } for o in Order.objects()]
+    ai = get_gemini()
+    period_list = ['daily', 'weekly', 'monthly', 'quarterly']
     period = request.GET.get('period', 'weekly')
+    if period not in period_list:
+        period = 'weekly'
+    # Pre-aggregated buckets keep the prompt size independent of order history
+    sales_data = sales_summary(period)
     report = ai.generate_kfc_business_report(sales_data, period=period)
-    period_list = ['daily', 'weekly', 'monthly', 'quarterly']
     return render(request, 'kfc/admin/analytics.html', {'report': report, 'period_list': period_list, 'period': period})
 
 
@@ -668,6 +800,36 @@ def chat_page(request):
     return render(request, 'kfc/customers/chat.html')
 
 
+# A streamed answer holds a WSGI worker thread until it finishes, so only a few may stream at once;
+# the rest get the same answer as one JSON reply
+chat_stream_slots = threading.BoundedSemaphore(int(getattr(settings, 'CHAT_STREAM_MAX_CONCURRENCY', 4)))
+
+
+class _SlotStream:
+    """Streaming response body that frees its chat_stream_slots slot when it ends or the response
+    is closed, including a response closed before streaming started."""
+
+    def __init__(self, chunks):
+        self._chunks = chunks
+        self._held = True
+
+    def __iter__(self):
+        try:
+            yield from self._chunks
+        finally:
+            self.close()
+
+    def close(self):
+        if not self._held:
+            return
+        self._held = False
+        try:
+            # Stops the upstream Gemini stream and frees its guarded_stream slot on client disconnect
+            self._chunks.close()
+        finally:
+            chat_stream_slots.release()
+
+
 @require_POST
 def chat_api(request):
     try:
@@ -678,92 +840,22 @@ def chat_api(request):
     history = payload.get('history') or []
     if not message:
         return JsonResponse({'error': 'empty_message'}, status=400)
-    # Build live catalog of ALL products and label availability/out-of-stock
-    try:
-        products_qs = Product.objects()
-    except Exception:
-        products_qs = Product.objects()
-    catalog = []
-    product_index = []  # (alias, product_obj)
-    for p in products_qs:
-        try:
-            in_stock = None
-            try:
-                in_stock = (p.stock_quantity is None) or (int(p.stock_quantity) > 0)
-            except Exception:
-                in_stock = None
-            catalog.append({
-                'name': p.name,
-                'category': getattr(p, 'category', ''),
-                'price': float(p.price),
-                'available': bool(getattr(p, 'is_available', True)),
-                'in_stock': bool(in_stock) if in_stock is not None else True,
-            })
-            # Build simple aliases: full name, lowercase, and naive plural
-            name = (p.name or '').strip()
-            if name:
-                base = name.lower()
-                aliases = {base}
-                # add naive plural forms for last word
-                parts = base.split()
-                if parts:
-                    last = parts[-1]
-                    if not last.endswith('s'):
-                        aliases.add(base + 's')
-                for a in aliases:
-                    product_index.append((a, p))
-        except Exception:
-            pass
     # Try parse ordering intent and add to cart
-    def parse_order(msg):
-        text = (msg or '').lower()
-        intent_words = ['order', 'buy', 'add', 'want', 'get', 'take']
-        looks_like_intent = any(w in text for w in intent_words) or re.search(r'\b\d+\b', text)
-        if not looks_like_intent:
-            return []
-        # support small number words
-        num_words = {
-            'a': 1, 'an': 1, 'one': 1, 'two': 2, 'three': 3, 'four': 4,
-            'five': 5, 'six': 6, 'seven': 7, 'eight': 8, 'nine': 9, 'ten': 10
-        }
-        items = []  # (product, qty)
-        used = set()
-        for alias, prod in product_index:
-            # pattern: "3 x alias" or "3 alias" or number word + alias
-            pat_num = rf"(\d+)\s*(?:x\s*)?{re.escape(alias)}\b"
-            m = re.search(pat_num, text)
-            qty = None
-            if m:
-                try:
-                    qty = int(m.group(1))
-                except Exception:
-                    qty = None
-            if qty is None:
-                # word numbers
-                for w, val in num_words.items():
-                    if re.search(rf"\b{w}\s+{re.escape(alias)}\b", text):
-                        qty = val
-                        break
-            if qty is None and alias in text:
-                qty = 1
-            if qty:
-                key = str(getattr(prod, 'id', ''))
-                if key not in used:
-                    items.append((prod, max(1, int(qty))))
-                    used.add(key)
-        return items
-
-    parsed = parse_order(message)
+    catalog = get_catalog()
+    parsed = catalog.matcher.parse(message)
     if parsed:
-        # Update session cart with stock checks (cap by available stock if tracked)
-        cart = _get_cart(request)
+        # Add to the cart with stock checks (cap by available stock if tracked)
+        lines = carts.get_lines(request)
+        stock_by_id = stock_levels([pid for pid, _ in parsed])
         added_lines = []
         total_add = 0.0
-        for prod, qty_req in parsed:
+        for pid, qty_req in parsed:
+            prod = catalog.get(pid)
+            if not prod:
+                continue
             try:
-                stock = getattr(prod, 'stock_quantity', None)
-                pid = str(getattr(prod, 'id'))
-                current_qty = int(cart.get(pid, {}).get('quantity', 0))
+                stock = stock_by_id.get(pid, 0) if prod.is_available else 0
+                current_qty = lines.get(pid, 0)
                 if stock is not None:
                     max_addable = max(0, int(stock) - current_qty)
                     add_qty = min(qty_req, max_addable)
@@ -771,15 +863,13 @@ def chat_api(request):
                     add_qty = qty_req
                 if add_qty <= 0:
                     continue
-                item = cart.get(pid, {'name': prod.name, 'price': float(prod.price), 'quantity': 0})
-                item['quantity'] = int(item['quantity']) + add_qty
-                cart[pid] = item
-                line_total = float(item['price']) * add_qty
+                carts.add_line(request, pid, add_qty)
+                lines[pid] = current_qty + add_qty
+                line_total = float(prod.price) * add_qty
                 total_add += line_total
                 added_lines.append(f"{prod.name} x {add_qty} - ${line_total:.2f}")
             except Exception:
                 pass
-        _save_cart(request, cart)
         if added_lines:
             summary = "\n".join(added_lines)
             reply = (
@@ -793,31 +883,32 @@ def chat_api(request):
     # Checkout intent
     text_lower = message.lower()
     if re.search(r"\b(check\s*out|checkout|proceed|pay|place\s+order|finish\s+order|go\s+to\s+checkout)\b", text_lower):
-        cart = _get_cart(request)
-        if not cart:
+        priced = _priced_cart(request)
+        if not priced:
             return JsonResponse({'reply': 'Your cart is empty. Say an item to add, or visit /menu to pick products.'})
-        items = []
-        total = 0.0
-        for pid, it in cart.items():
-            try:
-                qty = int(it.get('quantity', 0))
-                price = float(it.get('price', 0))
-                if qty > 0 and price >= 0:
-                    items.append({'quantity': qty, 'price': price})
-                    total += price * qty
-            except Exception:
-                pass
-        try:
-            total = cart_total(items)
-        except Exception:
-            pass
+        total = priced.total
         reply = (
             f"Great! Your current cart total is ${total:.2f}. "
             f"Click here to complete your order: /checkout/"
         )
+        if priced.issues:
+            reply = " ".join(priced.issues) + "\n" + reply
         return JsonResponse({'reply': reply})
 
-    # Otherwise, standard menu Q&A via Gemini
-    ai = KFCGeminiAI()
-    reply = ai.chat_about_menu(message, catalog=catalog, history=history)
+    # Otherwise, menu Q&A via Gemini over the products relevant to this question
+    menu_items, summary = menu_context(catalog, message, history)
+    ai = get_gemini()
+    if payload.get('stream') and chat_stream_slots.acquire(blocking=False):
+        # Relay the answer as Server-Sent Events so text shows up from the first token
+        def events():
+            for chunk in ai.chat_about_menu_stream(message, catalog=menu_items, history=history, summary=summary,
+                                                    max_seconds=float(getattr(settings, 'CHAT_STREAM_MAX_SECONDS', 30))):
+                yield _sse({'delta': chunk})
+            yield _sse({'done': True})
+
+        response = StreamingHttpResponse(_SlotStream(events()), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+    reply = ai.chat_about_menu(message, catalog=menu_items, history=history, summary=summary)
     return JsonResponse({'reply': reply})